@@ -0,0 +1,154 @@
+"""Coalesced updates of `accessed` timestamps.
+
+Reading a context, view or query records when it was last accessed. Rather
+than updating the row on every read, the timestamps are kept in process and
+written by a background thread every `SERRANO_ACCESS_FLUSH_INTERVAL` seconds
+with a single update per model (per chunk of objects). The pending timestamps
+are written when the process exits. An interval of 0 updates the row on every
+read.
+"""
+import os
+import time
+import atexit
+import logging
+from collections import defaultdict
+from datetime import datetime
+from threading import Lock, Thread
+from django.conf import settings
+from django.db import connections, router, transaction
+from serrano.validation import chunked, get_chunk_size
+
+__all__ = ('touch', 'flush', 'update_accessed', 'AccessBuffer')
+
+log = logging.getLogger(__name__)
+
+# Default number of seconds between writes of the timestamps
+DEFAULT_FLUSH_INTERVAL = 60
+
+
+def update_accessed(model, accessed):
+    """Sets the `accessed` timestamps of the objects of `model`.
+
+    `accessed` is a dict of timestamps keyed by primary key. The timestamps
+    are set with an `UPDATE` using a `CASE` expression on the primary key
+    per chunk of objects.
+    """
+    opts = model._meta
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+
+    field = opts.get_field('accessed')
+
+    # The type of the parameters of the `CASE` results is not inferred from
+    # the column, e.g. PostgreSQL types them as text, so they are cast to the
+    # column type. SQLite has no timestamp type to cast to.
+    value = '%s'
+    if connection.vendor != 'sqlite':
+        value = 'CAST(%s AS {0})'.format(field.db_type(connection))
+
+    sql = 'UPDATE {table} SET {column} = CASE {pk} {{cases}} END ' \
+          'WHERE {pk} IN ({{pks}})'.format(table=qn(opts.db_table),
+                                         column=qn(field.column),
+                                         pk=qn(opts.pk.column))
+
+    # Each object requires three parameters
+    size = max(get_chunk_size(using) // 3, 1)
+
+    cursor = connection.cursor()
+
+    for chunk in chunked(accessed.items(), size):
+        params = []
+
+        for pk, timestamp in chunk:
+            params.append(pk)
+            params.append(field.get_db_prep_value(timestamp, connection))
+
+        params.extend(pk for pk, timestamp in chunk)
+
+        cursor.execute(sql.format(
+            cases=' '.join(['WHEN %s THEN {0}'.format(value)] * len(chunk)),
+            pks=', '.join(['%s'] * len(chunk))), params)
+
+    transaction.commit_unless_managed(using=using)
+
+
+class AccessBuffer(object):
+    """Pending `accessed` timestamps keyed by model and primary key.
+
+    The timestamps are written by a background thread once per interval,
+    regardless of whether further objects are accessed.
+    """
+
+    def __init__(self):
+        self.pending = defaultdict(dict)
+        self.lock = Lock()
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        "Starts the flushing thread if it is not running in this process."
+        with self.lock:
+            # The thread does not survive forking, so a new one is started
+            # in each process
+            if self.thread is not None and self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+            self.thread = Thread(target=self.run, name='serrano-access')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(getattr(settings, 'SERRANO_ACCESS_FLUSH_INTERVAL',
+                               DEFAULT_FLUSH_INTERVAL) or
+                       DEFAULT_FLUSH_INTERVAL)
+
+            try:
+                self.flush()
+            finally:
+                # The thread has its own connections
+                for connection in connections.all():
+                    connection.close()
+
+    def touch(self, instance, timestamp=None):
+        "Records the instance was accessed."
+        interval = getattr(settings, 'SERRANO_ACCESS_FLUSH_INTERVAL',
+                           DEFAULT_FLUSH_INTERVAL)
+
+        if timestamp is None:
+            timestamp = datetime.now()
+
+        model = instance.__class__
+
+        if not interval:
+            model.objects.filter(pk=instance.pk).update(accessed=timestamp)
+            return
+
+        if self.thread is None or self.pid != os.getpid():
+            self.start()
+
+        with self.lock:
+            self.pending[model][instance.pk] = timestamp
+
+    def flush(self):
+        "Writes the pending timestamps."
+        with self.lock:
+            pending = self.pending
+            self.pending = defaultdict(dict)
+
+        for model, accessed in pending.items():
+            try:
+                update_accessed(model, accessed)
+            except Exception:
+                log.exception('Error updating accessed timestamps.',
+                              extra={'model': model._meta.object_name})
+
+
+buffer = AccessBuffer()
+
+atexit.register(buffer.flush)
+
+touch = buffer.touch
+flush = buffer.flush
@@ -1,10 +1,16 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
-from .tokens import token_generator
+from .tokens import token_generator, token_cache
 
 
 class TokenBackend(ModelBackend):
     def authenticate(self, token):
+        # Tokens that have already been verified do not require a lookup
+        user = token_cache.get(token)
+
+        if user is not None:
+            return user
+
         pk, token = token_generator.split(token)
 
         try:
@@ -18,4 +24,5 @@ class TokenBackend(ModelBackend):
             return
 
         if token_generator.check(user, token):
+            token_cache.set(token, user)
             return user
@@ -0,0 +1,166 @@
+"""Server-side binning of continuous distributions.
+
+Rather than grouping by every distinct value, each dimension is mapped to a
+bucket index in the `SELECT` clause and the rows are counted per bucket. The
+database returns at most `bins` rows per dimension regardless of the number
+of distinct values.
+"""
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+from django.db import connections
+from django.db.models import Count, Min, Max
+
+__all__ = ('WIDTH', 'QUANTILE', 'METHODS', 'binned_counts')
+
+# Buckets of equal width between the minimum and maximum value
+WIDTH = 'width'
+
+# Buckets containing roughly the same number of rows
+QUANTILE = 'quantile'
+
+METHODS = (WIDTH, QUANTILE)
+
+DEFAULT_BINS = 100
+
+
+def _column(tree, queryset, field):
+    """Sets up the joins to the data field's table and returns the queryset
+    and the quoted column reference.
+    """
+    queryset, alias = tree.add_joins(field.model, queryset)
+    qn = connections[queryset.db].ops.quote_name
+    return queryset, '{0}.{1}'.format(qn(alias), qn(field.field.column))
+
+
+def _floor(sql, vendor):
+    # SQLite does not have FLOOR, but truncation is equivalent since the
+    # expression is never negative.
+    if vendor == 'sqlite':
+        return 'CAST({0} AS INTEGER)'.format(sql)
+    return 'FLOOR({0})'.format(sql)
+
+
+def _quantile_edges(queryset, lookup, column, bins):
+    "Returns the values that split the rows into `bins` quantiles."
+    fractions = [float(i) / bins for i in range(1, bins)]
+
+    if not fractions:
+        return []
+
+    if connections[queryset.db].vendor == 'postgresql':
+        select = ('percentile_disc(ARRAY[{0}]::float8[]) WITHIN GROUP '
+                  '(ORDER BY {1})').format(', '.join(['%s'] * len(fractions)),
+                                           column)
+
+        edges = queryset.extra(select={'edges': select},
+                               select_params=fractions)\
+            .order_by().values_list('edges', flat=True)
+
+        return list(edges[0] or [])
+
+    # Other backends read the value at the offset of each quantile with a
+    # single row query, which is served by an index on the column. The context
+    # may apply `DISTINCT`, which would collapse equal values.
+    values = queryset.order_by(lookup).values_list(lookup, flat=True)
+    values.query.distinct = False
+    count = values.count()
+
+    if not count:
+        return []
+
+    offsets = [int(f * count) for f in fractions]
+
+    return [values[offset] for offset in offsets]
+
+
+def binned_counts(tree, queryset, fields, method=WIDTH, bins=DEFAULT_BINS):
+    """Returns a list of points with the count of rows in each bin.
+
+    The `values` of each point are the mid-points of the bin for each field
+    and `range` contains the lower and upper bound. Rows with a null value
+    for any of the fields are not counted.
+    """
+    vendor = connections[queryset.db].vendor
+    lookups = [tree.query_string_for_field(f.field) for f in fields]
+
+    for lookup in lookups:
+        queryset = queryset.filter(**{'{0}__isnull'.format(lookup): False})
+
+    aggregates = {}
+    for i, lookup in enumerate(lookups):
+        aggregates['min_{0}'.format(i)] = Min(lookup)
+        aggregates['max_{0}'.format(i)] = Max(lookup)
+
+    bounds = queryset.aggregate(**aggregates)
+
+    if bounds['min_0'] is None:
+        return []
+
+    select = OrderedDict()
+    params = []
+    edges = []
+
+    for i, (field, lookup) in enumerate(zip(fields, lookups)):
+        queryset, column = _column(tree, queryset, field)
+
+        lo = float(bounds['min_{0}'.format(i)])
+        hi = float(bounds['max_{0}'.format(i)])
+
+        if method == QUANTILE:
+            splits = sorted(set([float(e) for e in _quantile_edges(
+                queryset, lookup, column, bins)]))
+            splits = [e for e in splits if lo < e <= hi]
+
+            if splits:
+                cases = ' '.join(['WHEN {0} < %s THEN {1}'.format(column, j)
+                                  for j in range(len(splits))])
+                expr = 'CASE {0} ELSE {1} END'.format(cases, len(splits))
+                params.extend(splits)
+            else:
+                expr = '0'
+
+            edges.append([lo] + splits + [hi])
+        else:
+            width = (hi - lo) / bins or 1.0
+            expr = _floor('({0} - %s) / %s'.format(column), vendor)
+            params.extend([lo, width])
+
+            edges.append([lo + j * width for j in range(bins)] + [hi])
+
+        select['bin_{0}'.format(i)] = expr
+
+    names = select.keys()
+    pk_name = tree.root_model._meta.pk.name
+
+    rows = queryset.extra(select=select, select_params=params)\
+        .values(*names).annotate(count=Count(pk_name)).order_by(*names)
+
+    counts = OrderedDict()
+
+    for row in rows:
+        # The maximum value falls on the upper bound of the last width bin,
+        # so it is counted as part of it.
+        key = tuple([min(int(row[name]), len(edges[i]) - 2)
+                     for i, name in enumerate(names)])
+        counts[key] = counts.get(key, 0) + row['count']
+
+    points = []
+
+    for key, count in counts.items():
+        values = []
+        ranges = []
+
+        for i, index in enumerate(key):
+            start, end = edges[i][index], edges[i][index + 1]
+            values.append((start + end) / 2.0)
+            ranges.append([start, end])
+
+        points.append({
+            'values': values,
+            'range': ranges,
+            'count': count,
+        })
+
+    return points
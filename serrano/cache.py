@@ -0,0 +1,40 @@
+import json
+import hashlib
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Sum
+from avocado.models import DataField
+
+__all__ = ('hash_data', 'data_version', 'cache_key')
+
+
+def hash_data(data):
+    "Returns a hash of the canonical JSON representation of `data`."
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'),
+                         cls=DjangoJSONEncoder)
+    return hashlib.md5(encoded).hexdigest()
+
+
+def data_version(queryset=None):
+    """Returns a token that changes when the data of any field changes.
+
+    This is derived from the `data_version` counters of the fields in
+    `queryset`, defaulting to all fields. Since the counters only increase,
+    their sum changes as soon as the data of any field is modified, which
+    invalidates the cache entries including it.
+    """
+    if queryset is None:
+        queryset = DataField.objects.all()
+
+    aggregates = queryset.aggregate(count=Count('pk'),
+                                    version=Sum('data_version'))
+
+    if not aggregates['count']:
+        return ''
+    return '{0}:{1}'.format(aggregates['count'], aggregates['version'])
+
+
+def cache_key(prefix, data, version=None):
+    "Returns a cache key for `data` namespaced by `prefix`."
+    if version is None:
+        version = data_version()
+    return 'serrano:{0}:{1}'.format(prefix, hash_data([data, version]))
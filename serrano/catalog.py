@@ -0,0 +1,99 @@
+"""Cache of the serialized field and concept catalogs.
+
+The catalog changes rarely relative to how often it is requested, so the
+serialized output is cached per permission class and parameters. All entries
+are invalidated when a field, concept, category or concept field is saved or
+deleted by changing the catalog version.
+
+Links are stored relative to the host and made absolute for each request, so
+the same entry can be served for any host.
+"""
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from serrano.cache import cache_key
+
+__all__ = ('get_or_prepare', 'invalidate')
+
+# Default number of seconds catalogs are cached for
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+VERSION_KEY = 'serrano:catalog:version'
+
+
+def get_timeout():
+    "Returns the number of seconds catalogs are cached for."
+    return getattr(settings, 'SERRANO_CATALOG_CACHE_TIMEOUT',
+                   CATALOG_CACHE_TIMEOUT)
+
+
+def get_version_timeout():
+    """Returns the number of seconds the catalog version is cached for.
+
+    Changing the version invalidates every catalog, so it is kept for at
+    least as long as the catalogs rather than the backend's default timeout.
+    """
+    return max(get_timeout(), CATALOG_CACHE_TIMEOUT)
+
+
+def get_version():
+    "Returns the current catalog version."
+    version = cache.get(VERSION_KEY)
+
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, get_version_timeout())
+        version = cache.get(VERSION_KEY)
+
+    return version
+
+
+def invalidate(sender=None, **kwargs):
+    "Invalidates all cached catalogs."
+    cache.set(VERSION_KEY, uuid.uuid4().hex, get_version_timeout())
+
+
+def _relink(data, func):
+    "Applies `func` to every link href in the serialized data."
+    if isinstance(data, (list, tuple)):
+        for item in data:
+            _relink(item, func)
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            if key == '_links':
+                for link in value.values():
+                    link['href'] = func(link['href'])
+            elif isinstance(value, (list, dict)):
+                _relink(value, func)
+
+
+def get_or_prepare(request, name, data, prepare):
+    """Returns the cached catalog or the result of calling `prepare`.
+
+    `name` and `data` identify the catalog, e.g. the resource and the
+    parameters it was prepared with.
+    """
+    timeout = get_timeout()
+
+    if not timeout:
+        return prepare()
+
+    prefix = request.build_absolute_uri('/')[:-1]
+    key = cache_key('catalog:{0}'.format(name), data, version=get_version())
+
+    catalog = cache.get(key)
+
+    if catalog is None:
+        catalog = prepare()
+
+        # Only serialized data can be cached, not error responses
+        if not isinstance(catalog, list):
+            return catalog
+
+        _relink(catalog, lambda href: href[len(prefix):]
+                if href.startswith(prefix) else href)
+        cache.set(key, catalog, timeout)
+
+    _relink(catalog, lambda href: prefix + href
+            if href.startswith('/') else href)
+
+    return catalog
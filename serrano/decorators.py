@@ -20,7 +20,12 @@ def check_auth(func):
             token = get_token(request)
             user = authenticate(token=token)
             if user:
-                login(request, user)
+                # Stateless tokens only authenticate the current request
+                # rather than logging the user into a session.
+                if getattr(settings, 'SERRANO_STATELESS_TOKENS', False):
+                    request.user = user
+                else:
+                    login(request, user)
             elif auth_required:
                 return HttpResponse(status=401)
         return func(self, request, *args, **kwargs)
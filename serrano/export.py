@@ -0,0 +1,411 @@
+import os
+import logging
+import tempfile
+import multiprocessing
+from Queue import Queue, Full
+from threading import Thread, Event, Lock
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Min, Max
+from modeltree.tree import trees
+from avocado.export import registry as exporters, JSONExporter
+from avocado.export._json import JSONGeneratorEncoder
+from avocado.models import DataContext, DataView
+from avocado.query import pipeline
+
+__all__ = ('StreamBuffer', 'ExportError', 'write_json', 'stream_export',
+           'can_stream', 'can_shard', 'concat_shards', 'start_pool',
+           'get_pool', 'sharded_export')
+
+log = logging.getLogger(__name__)
+
+# Default number of bytes accumulated before a chunk is handed off to the
+# response and the maximum number of chunks buffered between the exporter
+# and the response. Together these bound the memory used by a stream.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_CHUNK_BACKLOG = 16
+
+# Export types that are written row by row and can be streamed
+STREAMING_TYPES = ('csv', 'json')
+
+# Sentinels denoting the exporter has finished writing or failed
+_EOF = object()
+_ERROR = object()
+
+
+class ExportError(Exception):
+    "Raised by the stream when the exporter failed part of the way through."
+
+
+class StreamClosed(Exception):
+    "Raised in the writing thread when the consumer has gone away."
+
+
+class StreamBuffer(object):
+    """File-like object that hands written data off to a bounded queue.
+
+    Exporters write to a file-like object, so this accumulates the writes
+    into chunks of roughly `chunk_size` bytes which are put on the queue for
+    the response to consume. Writes block while the queue is full which
+    keeps memory flat regardless of the size of the export.
+    """
+    def __init__(self, queue, closed, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.queue = queue
+        self.closed = closed
+        self.chunk_size = chunk_size
+        self._chunks = []
+        self._size = 0
+
+    def put(self, item):
+        # Poll so the writer is released if the consumer stops reading
+        while True:
+            if self.closed.is_set():
+                raise StreamClosed
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except Full:
+                pass
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        self._chunks.append(data)
+        self._size += len(data)
+
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._chunks:
+            chunk = ''.join(self._chunks)
+            self._chunks = []
+            self._size = 0
+            self.put(chunk)
+
+
+def write_json(exporter, iterable, buff, **kwargs):
+    """Writes the rows of a JSON export one at a time.
+
+    Avocado's JSON exporter encodes the rows as a single list, which reads
+    every row into memory before the first byte is written. The output is
+    the same, but each row is encoded and written as it is read.
+    """
+    encoder = JSONGeneratorEncoder()
+
+    buff.write('[')
+
+    for i, row in enumerate(exporter.read(iterable, **kwargs)):
+        if i:
+            buff.write(', ')
+        for chunk in encoder.iterencode(row):
+            buff.write(chunk)
+
+    buff.write(']')
+
+
+def _write(exporter, get_iterable, buff, **kwargs):
+    end = _EOF
+
+    try:
+        if isinstance(exporter, JSONExporter):
+            write_json(exporter, get_iterable(), buff, **kwargs)
+        else:
+            exporter.write(get_iterable(), buff, **kwargs)
+        buff.flush()
+    except StreamClosed:
+        log.debug('Export stream closed by the client')
+    except Exception:
+        log.exception('Error writing export stream')
+        end = _ERROR
+    finally:
+        # The exporter is run in its own thread which has its own database
+        # connection. Close it since the thread is done with it.
+        connection.close()
+
+        try:
+            buff.put(end)
+        except StreamClosed:
+            pass
+
+
+def stream_export(exporter, get_iterable, chunk_size=None, backlog=None,
+                  **kwargs):
+    """Returns a generator of encoded chunks written by `exporter`.
+
+    The exporter writes in a separate thread to a `StreamBuffer` while the
+    chunks are yielded as they become available. This enables a streaming
+    response to send the first bytes while the rest of the rows are still
+    being read and formatted.
+
+    `get_iterable` is called in the writing thread to get the rows. The
+    rows must be read using that thread's database connection, so the
+    iterable cannot be created by the caller.
+
+    If the exporter fails, `ExportError` is raised once the chunks written
+    so far have been yielded. This aborts the response rather than ending
+    it as if the export was complete.
+
+    Memory is only bounded for the formats in `STREAMING_TYPES`. Other
+    exporters, such as the zipped SAS and R exports, build the file before
+    writing it.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'SERRANO_EXPORT_CHUNK_SIZE',
+                             DEFAULT_CHUNK_SIZE)
+
+    if backlog is None:
+        backlog = getattr(settings, 'SERRANO_EXPORT_CHUNK_BACKLOG',
+                          DEFAULT_CHUNK_BACKLOG)
+
+    queue = Queue(maxsize=backlog)
+    closed = Event()
+    buff = StreamBuffer(queue, closed, chunk_size=chunk_size)
+
+    thread = Thread(target=_write, args=(exporter, get_iterable, buff),
+                    kwargs=kwargs)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            chunk = queue.get()
+            if chunk is _EOF:
+                break
+            if chunk is _ERROR:
+                raise ExportError('Error writing export stream')
+            yield chunk
+    finally:
+        # Signal the writer in case the generator is closed early, e.g. the
+        # client disconnected part of the way through the download.
+        closed.set()
+
+
+def can_stream(export_type):
+    "Returns true if the export is written row by row."
+    return export_type in STREAMING_TYPES
+
+
+# Export types whose output can be concatenated from independently
+# written shards.
+SHARDABLE_TYPES = ('csv', 'json')
+
+# Primary keys must be integers to be split into ranges
+SHARDABLE_PK_TYPES = ('AutoField', 'BigIntegerField', 'IntegerField',
+                      'PositiveIntegerField')
+
+# Bytes copied at a time when concatenating the shard files
+COPY_SIZE = 64 * 1024
+
+
+def can_shard(export_type, view, tree):
+    """Returns true if the export can be split into primary key ranges.
+
+    Only concatenable formats and integer primary keys are supported and
+    the view must not define an ordering since the rows are output in
+    primary key order.
+    """
+    if export_type not in SHARDABLE_TYPES:
+        return False
+
+    pk = trees[tree].root_model._meta.pk
+    if pk.get_internal_type() not in SHARDABLE_PK_TYPES:
+        return False
+
+    return not view.parse(tree=tree).ordering
+
+
+def get_pk_ranges(context, tree, shards):
+    "Splits the primary keys of the context's queryset into ranges."
+    pk_name = trees[tree].root_model._meta.pk.name
+    queryset = context.apply(tree=tree)
+
+    bounds = queryset.aggregate(lo=Min(pk_name), hi=Max(pk_name))
+    lo, hi = bounds['lo'], bounds['hi']
+
+    if lo is None:
+        return []
+
+    size = max(1, (hi - lo + 1) / shards + 1)
+
+    return [(start, min(start + size - 1, hi))
+            for start in xrange(lo, hi + 1, size)]
+
+
+def _export_shard(args):
+    """Writes a single primary key range of the export to a temporary file.
+
+    This runs in a worker process so the arguments are plain data.
+    """
+    export_type, tree, context_json, view_json, lo, hi = args
+
+    QueryProcessor = pipeline.query_processors.default
+    processor = QueryProcessor(context=DataContext(json=context_json),
+                               view=DataView(json=view_json),
+                               tree=tree, include_pk=False)
+
+    pk_name = trees[tree].root_model._meta.pk.name
+    queryset = trees[tree].get_queryset().filter(**{
+        '{0}__gte'.format(pk_name): lo,
+        '{0}__lte'.format(pk_name): hi,
+    }).order_by(pk_name)
+
+    exporter = processor.get_exporter(exporters[export_type])
+    iterable = processor.get_iterable(queryset=queryset)
+
+    fd, path = tempfile.mkstemp(prefix='serrano-shard-')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            exporter.write(iterable, f)
+    except Exception:
+        log.exception('Error writing export shard')
+        os.remove(path)
+        raise
+
+    return path
+
+
+def _read_csv_shard(f, header_written):
+    "Yields the shard's rows, the header is skipped if already written."
+    header = f.readline()
+    if header and not header_written:
+        yield header
+    for chunk in iter(lambda: f.read(COPY_SIZE), ''):
+        yield chunk
+
+
+def _read_json_shard(f, size):
+    "Yields the items of the shard's array without the enclosing brackets."
+    # Skip the leading bracket and stop before the trailing one
+    f.read(1)
+    remaining = size - 2
+
+    while remaining > 0:
+        chunk = f.read(min(COPY_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def concat_shards(export_type, paths):
+    """Returns a generator of the shard files concatenated in order.
+
+    CSV shards each have a header, which is only output once. JSON shards
+    are arrays whose items are joined into a single array. The files are
+    removed once they have been read.
+    """
+    paths = iter(paths)
+
+    try:
+        if export_type == 'json':
+            yield '['
+
+        written = False
+
+        for path in paths:
+            size = os.path.getsize(path)
+
+            try:
+                with open(path, 'rb') as f:
+                    if export_type == 'csv':
+                        for chunk in _read_csv_shard(f, written):
+                            yield chunk
+                        written = written or size > 0
+                    elif size > 2:
+                        if written:
+                            yield ', '
+                        for chunk in _read_json_shard(f, size):
+                            yield chunk
+                        written = True
+            finally:
+                os.remove(path)
+
+        if export_type == 'json':
+            yield ']'
+    finally:
+        # Remove the remaining shards if the export stopped part of the way
+        # through. Consuming the iterator waits for the pending shards.
+        _discard(paths)
+
+
+def _discard(paths):
+    while True:
+        try:
+            path = next(paths)
+        except StopIteration:
+            return
+        except Exception:
+            # The shard failed and has already been removed
+            continue
+
+        if os.path.exists(path):
+            os.remove(path)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = Lock()
+_processes = None
+
+
+def _init_worker():
+    # Database connections inherited from the parent process must not be
+    # used or closed by the worker since that would affect the parent. Each
+    # worker opens its own.
+    for conn in connections.all():
+        conn.connection = None
+
+
+def start_pool(processes=None):
+    """Starts the pool of processes parallel exports are written by.
+
+    A pool is started once per process on first use. Pools are keyed by the
+    process id since a pool inherited from a parent process, e.g. one
+    created before a prefork server forked its workers, cannot be used by
+    the child.
+    """
+    global _pool, _pool_pid, _processes
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            return _pool
+
+        if processes is None:
+            processes = getattr(settings, 'SERRANO_EXPORT_PROCESSES',
+                                None) or multiprocessing.cpu_count()
+
+        _pool = multiprocessing.Pool(processes=processes,
+                                     initializer=_init_worker)
+        _pool_pid = os.getpid()
+        _processes = processes
+
+    return _pool
+
+
+def get_pool():
+    "Returns the export pool of this process, starting it if necessary."
+    return start_pool()
+
+
+def sharded_export(export_type, context, view, tree):
+    """Returns a generator of the export written in parallel shards.
+
+    The primary keys of the queryset are split into ranges which are
+    formatted by the pool of worker processes returned by `get_pool`. The
+    shard files are then concatenated in order into a single CSV or JSON
+    document.
+    """
+    pool = get_pool()
+
+    tasks = [(export_type, tree, context.json, view.json, lo, hi)
+             for lo, hi in get_pk_ranges(context, tree, _processes)]
+
+    # Results are returned in the order of the tasks
+    return concat_shards(export_type, pool.imap(_export_shard, tasks))
@@ -0,0 +1,305 @@
+"""In-process indexes of field values for fast searching.
+
+An index is built from the distinct values of a field and kept in process for
+the field's data version. At most `SERRANO_VALUE_INDEX_CACHE_SIZE` indexes are
+kept, the least recently used ones are discarded. If `SERRANO_VALUE_INDEX_DIR`
+is set, indexes are also persisted to that directory as JSON so they are only
+built once per data version across processes. The directory is created with
+mode 0700 and must not be writable by other users. The index class is set by
+`SERRANO_VALUE_INDEX`, a dotted path to a `ValueIndex` subclass, or None to
+disable indexing.
+"""
+import os
+import stat
+import json
+import hashlib
+import logging
+import tempfile
+from array import array
+from threading import Lock
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+from django.conf import settings
+from django.utils.encoding import smart_unicode
+from django.utils.importlib import import_module
+
+__all__ = ('ValueIndex', 'TrigramIndex', 'get_index')
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INDEX = 'serrano.index.TrigramIndex'
+
+# Default maximum number of indexes kept in process
+DEFAULT_CACHE_SIZE = 50
+
+# Length of the n-grams indexed by the trigram index
+GRAM_SIZE = 3
+
+
+def get_index_dir():
+    "Returns the directory indexes are persisted to or None."
+    return getattr(settings, 'SERRANO_VALUE_INDEX_DIR', None)
+
+
+class ValueIndex(object):
+    "Base class for value indexes."
+
+    def __init__(self, version):
+        self.version = version
+
+    @classmethod
+    def supports(cls, instance):
+        "Returns true if the field's values can be indexed."
+        return instance.simple_type == 'string' and not (
+            instance.lexicon or instance.objectset)
+
+    def build(self, choices):
+        "Builds the index from an iterable of value/label pairs."
+        raise NotImplementedError
+
+    def search(self, query, limit=None):
+        """Returns a list of dicts with the value and label of the values
+        that contain `query`, case-insensitive.
+        """
+        raise NotImplementedError
+
+    def dump(self):
+        "Returns the state of the index that can be encoded as JSON."
+        raise NotImplementedError
+
+    def restore(self, data):
+        "Restores the index from the data returned by `dump`."
+        raise NotImplementedError
+
+
+class TrigramIndex(ValueIndex):
+    """Index of the lowercased values by their trigrams.
+
+    Queries of three or more characters are matched by checking only the
+    values containing the rarest trigram of the query. Shorter queries scan
+    the lowercased values.
+    """
+
+    def build(self, choices):
+        self.values = []
+        self.labels = []
+        self.keys = []
+        self.grams = {}
+
+        for i, (value, label) in enumerate(choices):
+            key = smart_unicode(value).lower()
+
+            self.values.append(value)
+            self.labels.append(label)
+            self.keys.append(key)
+
+            for gram in set(self._grams(key)):
+                if gram not in self.grams:
+                    self.grams[gram] = array('I')
+                self.grams[gram].append(i)
+
+    def _grams(self, text):
+        for i in xrange(len(text) - GRAM_SIZE + 1):
+            yield text[i:i + GRAM_SIZE]
+
+    def _scan_matches(self, query):
+        return [i for i, key in enumerate(self.keys) if query in key]
+
+    def _gram_matches(self, query):
+        postings = []
+
+        for gram in set(self._grams(query)):
+            if gram not in self.grams:
+                return []
+            postings.append(self.grams[gram])
+
+        candidates = min(postings, key=len)
+        return [i for i in candidates if query in self.keys[i]]
+
+    def search(self, query, limit=None):
+        query = smart_unicode(query).lower()
+
+        if len(query) < GRAM_SIZE:
+            indexes = self._scan_matches(query)
+        else:
+            indexes = self._gram_matches(query)
+
+        if limit is not None:
+            indexes = indexes[:limit]
+
+        return [{
+            'label': self.labels[i],
+            'value': self.values[i],
+        } for i in indexes]
+
+    def dump(self):
+        # The trigrams are cheap to rebuild relative to querying the values
+        return {'values': self.values, 'labels': self.labels}
+
+    def restore(self, data):
+        self.build(zip(data['values'], data['labels']))
+
+
+# Indexes loaded in this process keyed by field, least recently used first
+_indexes = OrderedDict()
+_lock = Lock()
+
+# Locks held while building the index of a field keyed by field
+_build_locks = {}
+
+
+def get_index_class():
+    path = getattr(settings, 'SERRANO_VALUE_INDEX', DEFAULT_INDEX)
+
+    if not path:
+        return
+
+    module, name = path.rsplit('.', 1)
+    return getattr(import_module(module), name)
+
+
+def get_version(instance):
+    "Returns a token that changes when the field or its data changes."
+    data = [instance.app_name, instance.model_name, instance.field_name]
+
+    data.append(str(instance.data_version))
+
+    return hashlib.md5(u':'.join(data).encode('utf-8')).hexdigest()
+
+
+def get_choices(instance):
+    "Returns an iterable of value/label pairs for the field."
+    if instance.enumerable:
+        return instance.choices()
+
+    # Avoid loading and caching all values at once
+    return ((value, smart_unicode(value))
+            for value in instance.values_list().iterator())
+
+
+def _ensure_index_dir(path):
+    "Creates the directory if needed and checks it is private."
+    try:
+        os.makedirs(path, 0700)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+    info = os.stat(path)
+
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP |
+                                                      stat.S_IWOTH):
+        raise OSError('Value index directory {0} must be owned by the '
+                      'current user and not writable by others'.format(path))
+
+
+def _index_path(instance):
+    return os.path.join(get_index_dir(), '{0}.json'.format(instance.pk))
+
+
+def _load(instance, klass, version):
+    try:
+        _ensure_index_dir(get_index_dir())
+
+        with open(_index_path(instance), 'rb') as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return
+
+    if not isinstance(data, dict) or data.get('version') != version:
+        return
+
+    index = klass(version)
+
+    try:
+        index.restore(data['index'])
+    except (KeyError, TypeError, ValueError):
+        return
+
+    return index
+
+
+def _save(instance, index):
+    index_dir = get_index_dir()
+
+    try:
+        _ensure_index_dir(index_dir)
+
+        # Rename into place so other processes never read a partial index
+        fd, tmp = tempfile.mkstemp(dir=index_dir)
+        with os.fdopen(fd, 'wb') as f:
+            json.dump({'version': index.version, 'index': index.dump()}, f)
+        os.rename(tmp, _index_path(instance))
+    except (IOError, OSError, TypeError, ValueError):
+        log.exception('Error saving value index', extra={
+            'field': instance.pk,
+        })
+
+
+def _get_cached(pk, version):
+    with _lock:
+        index = _indexes.pop(pk, None)
+
+        if index is not None and index.version == version:
+            # Reinserted as the most recently used
+            _indexes[pk] = index
+            return index
+
+
+def _set_cached(pk, index):
+    size = getattr(settings, 'SERRANO_VALUE_INDEX_CACHE_SIZE',
+                   DEFAULT_CACHE_SIZE)
+
+    with _lock:
+        _indexes.pop(pk, None)
+        _indexes[pk] = index
+
+        while len(_indexes) > max(size, 1):
+            _indexes.popitem(last=False)
+
+
+def _get_build_lock(pk):
+    with _lock:
+        if pk not in _build_locks:
+            _build_locks[pk] = Lock()
+        return _build_locks[pk]
+
+
+def get_index(instance):
+    """Returns the value index for the field or None if the field is not
+    indexable or indexing is disabled.
+
+    The index is loaded from disk or built if it does not exist or is out
+    of date with respect to the field's `data_version`. Indexes of different
+    fields are built concurrently.
+    """
+    klass = get_index_class()
+
+    if klass is None or not klass.supports(instance):
+        return
+
+    version = get_version(instance)
+    index = _get_cached(instance.pk, version)
+
+    if index is not None:
+        return index
+
+    with _get_build_lock(instance.pk):
+        index = _get_cached(instance.pk, version)
+
+        if index is None:
+            if get_index_dir():
+                index = _load(instance, klass, version)
+
+            if index is None:
+                index = klass(version)
+                index.build(get_choices(instance))
+
+                if get_index_dir():
+                    _save(instance, index)
+
+            _set_cached(instance.pk, index)
+
+    return index
@@ -0,0 +1,422 @@
+"""File-backed queue and local worker pool for background exports.
+
+Each job is stored as a JSON document in `SERRANO_EXPORT_JOBS_DIR`. Queued
+jobs are represented by a marker file in the `queue` subdirectory which a
+worker claims by atomically renaming it into the `claimed` subdirectory.
+This enables multiple processes to share the same directory without an
+external broker.
+
+The claimed marker is removed once the job is complete or failed. A job
+whose marker remains claimed without progress for
+`SERRANO_EXPORT_JOB_TIMEOUT` seconds is assumed to have been interrupted,
+e.g. by the worker process exiting, and is marked as failed. Finished jobs
+and their files are removed after `SERRANO_EXPORT_JOB_EXPIRY` seconds.
+"""
+import os
+import stat
+import json
+import uuid
+import logging
+import tempfile
+import time
+from datetime import datetime
+from threading import Thread, Event, Lock
+from django.conf import settings
+from django.db import connection
+from avocado.export import registry as exporters
+from avocado.models import DataContext, DataView
+from avocado.query import pipeline
+
+__all__ = ('ExportJob', 'enqueue', 'start_workers')
+
+log = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+# Number of rows between persisting the progress of a running job
+PROGRESS_INTERVAL = 1000
+
+# Seconds between polling the queue directory for new jobs
+POLL_INTERVAL = 5
+
+# Default seconds a running job may go without progress before it is
+# considered interrupted
+JOB_TIMEOUT = 60 * 60
+
+# Default seconds finished jobs and their files are kept for
+JOB_EXPIRY = 60 * 60 * 24
+
+
+def get_jobs_dir():
+    return getattr(settings, 'SERRANO_EXPORT_JOBS_DIR', os.path.join(
+        tempfile.gettempdir(), 'serrano-exports'))
+
+
+def _ensure_dir(path):
+    """Creates the directory if needed and checks it is private.
+
+    Exported files contain the data being exported, so the directory must
+    not be shared with other users, e.g. when it is in the system's
+    temporary directory.
+    """
+    try:
+        os.makedirs(path, 0700)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+    info = os.stat(path)
+
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP |
+                                                      stat.S_IWOTH):
+        raise OSError('Export jobs directory {0} must be owned by the '
+                      'current user and not writable by others'.format(path))
+
+
+def _create(path):
+    "Creates the file readable only by the current user and opens it."
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+    return os.fdopen(fd, 'wb')
+
+
+class ExportJob(object):
+    "An export running or queued to run in the background."
+
+    fields = ('id', 'export_type', 'tree', 'context', 'view', 'user_id',
+              'session_key', 'status', 'rows', 'total', 'filename',
+              'created', 'finished', 'error')
+
+    def __init__(self, **kwargs):
+        for key in self.fields:
+            setattr(self, key, kwargs.get(key))
+
+        if self.id is None:
+            self.id = uuid.uuid4().hex
+        if self.status is None:
+            self.status = QUEUED
+        if self.rows is None:
+            self.rows = 0
+        if self.created is None:
+            self.created = datetime.now().isoformat()
+
+    @classmethod
+    def path_for(cls, job_id, ext='json'):
+        return os.path.join(get_jobs_dir(), '{0}.{1}'.format(job_id, ext))
+
+    @classmethod
+    def load(cls, job_id):
+        "Returns the job for `job_id` or None if it does not exist."
+        # Job ids are generated hex strings, reject anything else to prevent
+        # reading arbitrary paths.
+        try:
+            int(job_id, 16)
+        except (ValueError, TypeError):
+            return
+
+        try:
+            with open(cls.path_for(job_id)) as f:
+                return cls(**json.load(f))
+        except (IOError, ValueError):
+            pass
+
+    @property
+    def path(self):
+        return self.path_for(self.id)
+
+    @property
+    def file_path(self):
+        "Path of the exported file."
+        if self.filename:
+            return os.path.join(get_jobs_dir(), self.filename)
+
+    @property
+    def is_finished(self):
+        return self.status in (COMPLETE, FAILED)
+
+    @property
+    def percent(self):
+        if self.status == COMPLETE:
+            return 100
+        if not self.total:
+            return 0
+        return min(99, int(self.rows * 100 / self.total))
+
+    def is_owner(self, request):
+        if getattr(request, 'user', None) and request.user.is_authenticated():
+            return self.user_id == request.user.pk
+        return (self.session_key is not None and
+                self.session_key == request.session.session_key)
+
+    def save(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+        data = dict((key, getattr(self, key)) for key in self.fields)
+
+        # Write to a temporary file and rename it so readers never see a
+        # partially written document.
+        _ensure_dir(get_jobs_dir())
+        fd, tmp = tempfile.mkstemp(dir=get_jobs_dir())
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp, self.path)
+
+    def run(self):
+        "Runs the export and writes the file to the jobs directory."
+        exporter_class = exporters[self.export_type]
+
+        QueryProcessor = pipeline.query_processors.default
+        processor = QueryProcessor(context=DataContext(json=self.context),
+                                   view=DataView(json=self.view),
+                                   tree=self.tree, include_pk=False)
+
+        exporter = processor.get_exporter(exporter_class)
+
+        filename = '{0}.{1}'.format(self.id, exporter.file_extension)
+        self.save(status=RUNNING, filename=filename,
+                  total=processor.get_queryset().count())
+
+        iterable = self._track(processor.get_iterable())
+
+        with _create(self.file_path) as f:
+            exporter.write(iterable, f)
+
+        self.save(status=COMPLETE, finished=datetime.now().isoformat())
+
+    def _track(self, iterable):
+        "Wraps the iterable to periodically persist the number of rows."
+        rows = 0
+        for row in iterable:
+            yield row
+            rows += 1
+            if rows % PROGRESS_INTERVAL == 0:
+                self.save(rows=rows)
+        self.rows = rows
+
+
+class ExportQueue(object):
+    "Queue of jobs backed by marker files in the jobs directory."
+
+    def __init__(self):
+        self.event = Event()
+
+    @property
+    def queue_dir(self):
+        return os.path.join(get_jobs_dir(), 'queue')
+
+    @property
+    def claimed_dir(self):
+        return os.path.join(get_jobs_dir(), 'claimed')
+
+    def put(self, job):
+        _ensure_dir(self.queue_dir)
+        # Marker names are prefixed with the time they were queued so the
+        # jobs are claimed in order.
+        name = '{0}-{1}'.format(datetime.now().strftime('%Y%m%d%H%M%S%f'),
+                                job.id)
+        _create(os.path.join(self.queue_dir, name)).close()
+        self.event.set()
+
+    def claim(self):
+        """Claims the next queued job, returns None if the queue is empty.
+
+        The marker of the claimed job must be removed with `release` once
+        the job is finished.
+        """
+        _ensure_dir(self.queue_dir)
+        _ensure_dir(self.claimed_dir)
+
+        for name in sorted(os.listdir(self.queue_dir)):
+            marker = os.path.join(self.claimed_dir, name)
+
+            try:
+                os.rename(os.path.join(self.queue_dir, name), marker)
+            except OSError:
+                # Claimed by another worker
+                continue
+
+            # Time out the job from when it was claimed rather than queued
+            os.utime(marker, None)
+
+            job = ExportJob.load(name.rsplit('-', 1)[-1])
+
+            if job is None:
+                os.remove(marker)
+                continue
+
+            job.marker = marker
+            return job
+
+    def release(self, job):
+        "Removes the marker of a finished job."
+        try:
+            os.remove(job.marker)
+        except OSError:
+            pass
+
+    def fail_stale(self):
+        "Marks claimed jobs that have stopped making progress as failed."
+        timeout = getattr(settings, 'SERRANO_EXPORT_JOB_TIMEOUT', JOB_TIMEOUT)
+
+        _ensure_dir(self.claimed_dir)
+
+        for name in os.listdir(self.claimed_dir):
+            job = ExportJob.load(name.rsplit('-', 1)[-1])
+
+            if job is not None and not job.is_finished:
+                # The marker is touched when the job is claimed and the job
+                # document is saved as progress is made
+                try:
+                    idle = time.time() - max(
+                        os.path.getmtime(job.path),
+                        os.path.getmtime(os.path.join(self.claimed_dir,
+                                                      name)))
+                except OSError:
+                    continue
+
+                if idle < timeout:
+                    continue
+
+                log.error('Export job was interrupted', extra={'job': job.id})
+                job.save(status=FAILED, error='The export was interrupted.',
+                         finished=datetime.now().isoformat())
+
+            try:
+                os.remove(os.path.join(self.claimed_dir, name))
+            except OSError:
+                pass
+
+    def purge(self):
+        "Removes finished jobs and their files once they have expired."
+        expiry = getattr(settings, 'SERRANO_EXPORT_JOB_EXPIRY', JOB_EXPIRY)
+        jobs_dir = get_jobs_dir()
+
+        for name in os.listdir(jobs_dir):
+            job_id, ext = os.path.splitext(name)
+
+            if ext != '.json':
+                continue
+
+            job = ExportJob.load(job_id)
+
+            if job is None or not job.is_finished:
+                continue
+
+            try:
+                if time.time() - os.path.getmtime(job.path) < expiry:
+                    continue
+
+                if job.file_path and os.path.exists(job.file_path):
+                    os.remove(job.file_path)
+
+                os.remove(job.path)
+            except OSError:
+                pass
+
+    def wait(self, timeout):
+        self.event.wait(timeout)
+        self.event.clear()
+
+
+class ExportWorkerPool(object):
+    "Pool of threads that run queued export jobs."
+
+    def __init__(self, queue, size):
+        self.queue = queue
+        self.size = size
+        self.threads = []
+        self.lock = Lock()
+        self.stopped = Event()
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+
+            self.stopped.clear()
+
+            for i in range(self.size):
+                thread = Thread(target=self.work,
+                                name='serrano-export-{0}'.format(i))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        "Stops the workers once their current jobs are finished."
+        with self.lock:
+            threads, self.threads = self.threads, []
+            self.stopped.set()
+            self.queue.event.set()
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def work(self):
+        while not self.stopped.is_set():
+            # The worker must outlive errors reading the queue, e.g. if the
+            # jobs directory is removed.
+            try:
+                job = self.queue.claim()
+            except Exception:
+                log.exception('Error claiming export job')
+                job = None
+
+            if job is None:
+                try:
+                    self.queue.fail_stale()
+                    self.queue.purge()
+                except Exception:
+                    log.exception('Error cleaning up export jobs')
+
+                if not self.stopped.is_set():
+                    self.queue.wait(POLL_INTERVAL)
+                continue
+
+            try:
+                job.run()
+            except Exception as e:
+                log.exception('Error running export job',
+                              extra={'job': job.id})
+                job.save(status=FAILED, error=unicode(e),
+                         finished=datetime.now().isoformat())
+            finally:
+                connection.close()
+
+            # Only released once the job has a terminal status
+            self.queue.release(job)
+
+
+queue = ExportQueue()
+
+pool = ExportWorkerPool(
+    queue, getattr(settings, 'SERRANO_EXPORT_JOB_WORKERS', 2))
+
+
+def start_workers():
+    "Starts the local worker pool if it is not already running."
+    pool.start()
+
+
+def enqueue(request, export_type, context, view, tree):
+    "Creates a job for the export and puts it on the queue."
+    job = ExportJob(export_type=export_type, tree=tree,
+                    context=context.json, view=view.json)
+
+    if getattr(request, 'user', None) and request.user.is_authenticated():
+        job.user_id = request.user.pk
+    else:
+        # The job is owned by the session, so one must exist for the
+        # creator to be able to poll it.
+        if request.session.session_key is None:
+            request.session.save()
+        job.session_key = request.session.session_key
+
+    job.save()
+    queue.put(job)
+    start_workers()
+
+    return job
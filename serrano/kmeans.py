@@ -0,0 +1,196 @@
+"""Vectorized implementation of the `avocado.stats.kmeans` functions used
+for field distributions.
+
+The functions mirror the signatures and return values of their Avocado
+counterparts, but operate on NumPy arrays rather than lists of lists. NumPy
+is an optional dependency, `available` denotes whether it is installed.
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('available', 'to_arrays', 'to_points', 'split_outliers',
+           'find_outliers', 'weighted_counts')
+
+available = numpy is not None
+
+# Maximum number of points compared against the centroids at once. This
+# bounds the size of the intermediate distance matrix.
+BLOCK_SIZE = 10000
+
+
+def to_arrays(rows):
+    """Returns an N x M float array of the values and an array of the counts
+    of the rows. The count is the last column of each row.
+    """
+    data = numpy.array(rows, dtype=float)
+    return data[:, :-1], data[:, -1].astype(int)
+
+
+def to_points(points, counts):
+    "Returns a list of dicts with the `values` and `count` of each point."
+    return [{'values': values, 'count': count}
+            for values, count in zip(points.tolist(), counts.tolist())]
+
+
+def split_outliers(points, counts, outliers):
+    """Returns the list of points other than the `outliers` indexes and the
+    list of outlier points, each as returned by `to_points`.
+    """
+    mask = numpy.ones(len(points), dtype=bool)
+    mask[outliers] = False
+
+    return (to_points(points[mask], counts[mask]),
+            to_points(points[outliers], counts[outliers]))
+
+
+def normalize(points):
+    """Divides each dimension by its standard deviation.
+
+    Dimensions with a standard deviation of zero are set to zero.
+    """
+    std = points.std(axis=0)
+    safe = numpy.where(std == 0, 1, std)
+    return numpy.where(std == 0, 0.0, points / safe)
+
+
+def compute_clusters(points, centroids):
+    """Returns the index of the closest centroid for each point and the
+    Euclidean distance to it.
+    """
+    n = len(points)
+    indexes = numpy.empty(n, dtype=int)
+    distances = numpy.empty(n, dtype=float)
+
+    for start in xrange(0, n, BLOCK_SIZE):
+        block = points[start:start + BLOCK_SIZE]
+
+        # Squared distances between every point in the block and every
+        # centroid, an B x K matrix.
+        diff = block[:, numpy.newaxis, :] - centroids[numpy.newaxis, :, :]
+        sqr = (diff ** 2).sum(axis=2)
+
+        idx = sqr.argmin(axis=1)
+        indexes[start:start + BLOCK_SIZE] = idx
+        distances[start:start + BLOCK_SIZE] = sqr[numpy.arange(len(idx)), idx]
+
+    return indexes, numpy.sqrt(distances)
+
+
+def kmeans(points, centroids, threshold=1e-5):
+    """Runs k-means from the initial `centroids` until the mean distance
+    improves by less than `threshold`.
+
+    Returns the centroids and the mean distance of the points to them.
+    """
+    centroids = numpy.array(centroids, dtype=float)
+    mean_difference = float('inf')
+    previous_mean_distance = None
+
+    while mean_difference > threshold:
+        indexes, distances = compute_clusters(points, centroids)
+        mean_distance = distances.mean()
+
+        if previous_mean_distance is not None:
+            mean_difference = previous_mean_distance - mean_distance
+
+        if mean_difference > threshold:
+            k = len(centroids)
+            sizes = numpy.bincount(indexes, minlength=k)
+
+            sums = numpy.zeros(centroids.shape, dtype=float)
+            for d in xrange(points.shape[1]):
+                sums[:, d] = numpy.bincount(indexes, weights=points[:, d],
+                                            minlength=k)
+
+            # Move each centroid to the mean of its members and remove the
+            # centroids of empty clusters.
+            nonempty = sizes > 0
+            centroids = sums[nonempty] / sizes[nonempty][:, numpy.newaxis]
+
+        previous_mean_distance = mean_distance
+
+    return centroids, previous_mean_distance
+
+
+def find_outliers(points, outlier_threshold=3, normalized=True):
+    "Returns the indexes of the points that are outliers."
+    points = numpy.asarray(points, dtype=float)
+
+    if not normalized:
+        points = normalize(points)
+
+    # The initial centroid is the mid-point of each sorted dimension
+    midpoint = (len(points) - 1) // 2
+    centroid = numpy.sort(points, axis=0)[midpoint]
+
+    centroids, _ = kmeans(points, centroid[numpy.newaxis, :])
+    _, distances = compute_clusters(points, centroids)
+
+    mean_distance = distances.mean()
+
+    if mean_distance <= 0:
+        return []
+
+    return numpy.nonzero(distances / mean_distance >=
+                         outlier_threshold)[0].tolist()
+
+
+def weighted_counts(points, counts, k, outlier_threshold=3):
+    """Clusters the points and returns the weighted count of each centroid.
+
+    Returns a list of points with the `values` of the centroid and the
+    weighted `count`, and the list of outlier values that were removed prior
+    to clustering.
+    """
+    points = numpy.asarray(points, dtype=float)
+    counts = numpy.asarray(counts, dtype=float)
+
+    outliers = find_outliers(points, outlier_threshold, normalized=False)
+
+    mask = numpy.ones(len(points), dtype=bool)
+    mask[outliers] = False
+
+    inliers = points[mask]
+    counts = counts[mask]
+    n = len(inliers)
+
+    if not n:
+        return [], points[outliers].tolist()
+
+    k = max(1, min(k or int(math.sqrt(n // 2)), n))
+
+    # The standard deviation is used to denormalize the centroids
+    std = inliers.std(axis=0)
+    norm_points = normalize(inliers)
+
+    # Initial centroids are evenly spaced along the sorted dimensions
+    step = n // k
+    initial_centroids = numpy.sort(norm_points, axis=0)[step // 2::step]
+
+    centroids, _ = kmeans(norm_points, initial_centroids)
+    indexes, distances = compute_clusters(norm_points, centroids)
+
+    # Weight the count of each point by its relative distance to the
+    # centroid of its cluster.
+    size = len(centroids)
+    dist_sums = numpy.bincount(indexes, weights=distances, minlength=size)
+    point_sums = dist_sums[indexes]
+
+    safe = numpy.where(point_sums == 0, 1, point_sums)
+    weighted = numpy.where(point_sums == 0, counts,
+                           (1 - distances / safe) * counts)
+    totals = numpy.bincount(indexes, weights=weighted, minlength=size)
+
+    centroid_counts = []
+
+    for centroid, total in zip((centroids * std).tolist(), totals.tolist()):
+        centroid_counts.append({
+            'values': centroid,
+            'count': int(total),
+        })
+
+    return centroid_counts, points[outliers].tolist()
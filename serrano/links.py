@@ -0,0 +1,60 @@
+"""Hypermedia link templates.
+
+Resolving a named route with `reverse` walks the URL resolver, which adds up
+when links are generated for every serialized object. Each route is instead
+resolved once into a format string with placeholders for its arguments, and
+the scheme and host of the request are applied once per request, so building
+a link only requires string formatting.
+"""
+from threading import Lock
+from django.core.urlresolvers import reverse, get_script_prefix, get_urlconf
+
+__all__ = ('get_template', 'get_links', 'Links')
+
+# Placeholder arguments used to resolve the routes. These are numeric so they
+# match the primary key patterns of the routes.
+PLACEHOLDER = '90000000{0}'
+
+_templates = {}
+_lock = Lock()
+
+
+def get_template(name, nargs=1):
+    "Returns the path format string for the named route and argument count."
+    key = (get_urlconf(), get_script_prefix(), name, nargs)
+    template = _templates.get(key)
+
+    if template is None:
+        args = [PLACEHOLDER.format(i) for i in range(nargs)]
+        path = reverse(name, args=args)
+
+        template = path.replace('{', '{{').replace('}', '}}')
+
+        for i, arg in enumerate(args):
+            template = template.replace(arg, '{%d}' % i)
+
+        with _lock:
+            _templates[key] = template
+
+    return template
+
+
+class Links(object):
+    "Builds absolute links to named routes for a request."
+
+    def __init__(self, request):
+        self.prefix = request.build_absolute_uri('/')[:-1]
+
+    def __call__(self, name, *args):
+        return self.prefix + get_template(name, len(args)).format(*args)
+
+
+def get_links(request):
+    "Returns the link builder for the request."
+    links = getattr(request, '_serrano_links', None)
+
+    if links is None:
+        links = Links(request)
+        request._serrano_links = links
+
+    return links
@@ -0,0 +1,37 @@
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from avocado.management.base import DataFieldCommand
+from serrano.stats import refresh_stats
+
+__doc__ = """\
+Computes and stores the stats served by the field stats endpoint. Only fields
+whose data has been modified since their stats were computed are refreshed,
+pass `--force` to compute stats for all fields.
+"""
+
+
+class Command(DataFieldCommand):
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('--force', action='store_true',
+                    help='Computes stats for fields that are up-to-date.'),
+
+        make_option('--processes', type='int', default=None,
+                    help='Number of processes to compute stats in parallel. '
+                         'Defaults to the SERRANO_STATS_PROCESSES setting.'),
+    )
+
+    def handle_fields(self, fields, **options):
+        t0 = time.time()
+
+        # Stats are not supported for searchable fields
+        fields = [f for f in fields if not f.searchable]
+
+        count = refresh_stats(fields, force=options.get('force'),
+                              processes=options.get('processes'))
+
+        self.stdout.write(u'{0} of {1} fields have been updated ({2} s)'
+                          .format(count, len(fields),
+                                  round(time.time() - t0, 2)))
@@ -1,7 +1,25 @@
+from django.conf import settings
+from django.contrib.auth import authenticate
+from serrano.decorators import get_token
+
+
 class SessionMiddleware(object):
     def process_request(self, request):
         if getattr(request, 'user', None) and request.user.is_authenticated():
             return
+
+        # Requests authenticated by a stateless token do not use the session,
+        # so neither the test cookie nor a new session is saved for them.
+        if getattr(settings, 'SERRANO_STATELESS_TOKENS', False):
+            token = get_token(request)
+
+            if token:
+                user = authenticate(token=token)
+
+                if user:
+                    request.user = user
+                    return
+
         session = request.session
         # Ensure the session is created view processing, but only if a cookie
         # had been previously set. This is to prevent creating exorbitant
@@ -0,0 +1,38 @@
+from django.db import models
+from django.db.models.signals import post_save, pre_delete, class_prepared
+from django.contrib.auth.models import User
+from jsonfield import JSONField
+from avocado.models import DataField, DataConcept, DataCategory, \
+    DataConceptField
+from serrano import catalog, orphans, tokens
+
+
+class DataFieldStats(models.Model):
+    """Precomputed statistics for a field.
+
+    The stats remain valid for as long as the field's `data_version`
+    matches the one they were computed for.
+    """
+    field = models.OneToOneField(DataField, related_name='+')
+    data_version = models.IntegerField(null=True)
+    stats = JSONField(default=dict)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u'Stats for {0}'.format(self.field)
+
+    def is_stale(self, instance):
+        return self.data_version != instance.data_version
+
+
+# Register catalog cache invalidation handlers
+for model in (DataField, DataConcept, DataCategory, DataConceptField):
+    post_save.connect(catalog.invalidate, sender=model)
+    pre_delete.connect(catalog.invalidate, sender=model)
+
+# Orphans are resolved against the installed models
+class_prepared.connect(orphans.clear)
+
+# Cached tokens are invalidated along with the user's tokens
+post_save.connect(tokens.invalidate_tokens, sender=User)
+pre_delete.connect(tokens.remove_tokens, sender=User)
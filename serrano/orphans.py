@@ -0,0 +1,89 @@
+"""Detection of orphaned fields.
+
+A field is orphaned if the model or model field it references is not
+installed. The natural keys of the installed model fields are collected into
+a registry once since the installed models do not change for the lifetime
+of the process. The registry is rebuilt if a model is prepared afterwards.
+"""
+import logging
+from django.db import models
+from avocado.models import DataField, DataConceptField
+from serrano.validation import chunked, get_chunk_size
+
+__all__ = ('is_orphaned', 'get_orphaned_fields', 'get_orphaned_concepts',
+           'clear')
+
+log = logging.getLogger(__name__)
+
+_installed = None
+
+
+def clear(sender=None, **kwargs):
+    "Clears the registry of installed fields."
+    global _installed
+    _installed = None
+
+
+def get_installed():
+    "Returns the set of natural keys of the installed model fields."
+    global _installed
+
+    if _installed is None:
+        installed = set()
+
+        for model in models.get_models(include_auto_created=True):
+            opts = model._meta
+
+            for field in opts.fields + opts.many_to_many:
+                installed.add((opts.app_label, opts.module_name, field.name))
+
+        _installed = installed
+
+    return _installed
+
+
+def is_orphaned(app_name, model_name, field_name):
+    "Returns true if the field referenced by the natural key is orphaned."
+    key = (app_name, model_name.lower(), field_name)
+    return key not in get_installed()
+
+
+def get_orphaned_fields():
+    "Returns the set of primary keys of the orphaned fields."
+    orphaned = set()
+
+    fields = DataField.objects.values_list('pk', 'app_name', 'model_name',
+                                           'field_name')
+
+    for pk, app_name, model_name, field_name in fields:
+        if is_orphaned(app_name, model_name, field_name):
+            log.error('Field is an orphan.', extra={'field': pk})
+            orphaned.add(pk)
+
+    return orphaned
+
+
+def get_orphaned_concepts(pks):
+    """Returns the set of primary keys of the concepts that have one or more
+    orphaned fields.
+
+    The fields of all concepts are read in a single query per chunk of
+    primary keys rather than a query per concept.
+    """
+    orphaned = set()
+    queryset = DataConceptField.objects.all()
+
+    for chunk in chunked(pks, get_chunk_size(queryset.db)):
+        links = queryset.filter(concept__in=chunk).values_list(
+            'concept_id', 'field_id', 'field__app_name', 'field__model_name',
+            'field__field_name')
+
+        for concept_id, field_id, app_name, model_name, field_name in links:
+            if is_orphaned(app_name, model_name, field_name):
+                log.error('Concept has orphaned field.', extra={
+                    'concept': concept_id,
+                    'field': field_id,
+                })
+                orphaned.add(concept_id)
+
+    return orphaned
@@ -1,11 +1,15 @@
 import functools
-from datetime import datetime
 from django.conf import settings
-from django.core.cache import cache
+try:
+    from django.http.response import HttpResponseBase
+except ImportError:
+    # Django 1.4 only has the regular response class
+    from django.http import HttpResponse as HttpResponseBase
 from restlib2.params import Parametizer
 from restlib2.resources import Resource
 from avocado.models import DataContext, DataView, DataQuery
 from ..decorators import check_auth
+from ..throttle import get_limiter
 from .. import cors
 
 __all__ = ('BaseResource', 'ThrottledResource')
@@ -192,7 +196,26 @@ class BaseResource(Resource):
     def __call__(self, request, **kwargs):
         return super(BaseResource, self).__call__(request, **kwargs)
 
+    def render(self, request, content, *args, **kwargs):
+        # restlib2 only passes `HttpResponse` instances through as responses,
+        # other response types such as streaming responses are returned as is.
+        if isinstance(content, HttpResponseBase):
+            return content
+
+        return super(BaseResource, self).render(request, content, *args,
+                                                **kwargs)
+
     def process_response(self, request, response):
+        # Streaming responses do not have content that can be inspected
+        # for the no content check or etag calculation, so only the cache
+        # and CORS headers are applied. Django 1.4 does not have streaming
+        # responses, so iterators are passed to a regular response instead.
+        if getattr(response, 'streaming', False) or \
+                getattr(response, '_base_content_is_iter', False):
+            self.response_cache_control(request, response)
+            return cors.patch_response(request, response,
+                                       self.allowed_methods)
+
         response = super(BaseResource, self).process_response(
             request, response)
         response = cors.patch_response(request, response, self.allowed_methods)
@@ -254,38 +277,5 @@ class ThrottledResource(BaseResource):
             # here and let other methods decide how to deal with the bot.
             return False
 
-        # Construct the cache key from the request identifier and lookup
-        # the current cached value for the key. The counts that are stored in
-        # the cache are tuples where the 1st value is the request count for
-        # the given time interval and the 2nd value is the start of the
-        # time interval.
-        cache_key = 'serrano:data_request:{0}'.format(request_id)
-        current_count = cache.get(cache_key)
-
-        # If there is nothing cached for this key then add a new cache value
-        # with a count of 1 and interval starting at the current date and time.
-        # Obviously, if nothing is cached then we can't have had too many
-        # requests as this is the first one so we return False here.
-        if current_count is None:
-            cache.set(cache_key, (1, datetime.now()))
-            return False
-        else:
-            # Calculate the time in seconds between the current date and time
-            # and the interval start from the cached value.
-            interval = (datetime.now() - current_count[1]).seconds
-
-            # If we have exceeded the interval size then reset the interval
-            # start time and reset the request count to 1 since we are on a
-            # new interval now.
-            if interval > limit_seconds:
-                cache.set(cache_key, (1, datetime.now()))
-                return False
-
-            # Update the request count to account for this request
-            new_count = current_count[0] + 1
-            cache.set(cache_key, (new_count, current_count[1]))
-
-            # Since we are still within the interval, just check if we have
-            # exceeded the request limit or not and return the result of the
-            # comparison.
-            return new_count > limit_count
+        return get_limiter().is_limited(request_id, limit_count,
+                                        limit_seconds)
@@ -1,45 +1,37 @@
-import logging
 import functools
+from copy import deepcopy
+from collections import defaultdict
 from django.conf.urls import patterns, url
-from django.core.urlresolvers import reverse
 from django.http import HttpResponse
-from preserialize.serialize import serialize
+from serrano.serializers import serialize
 from restlib2.http import codes
 from restlib2.params import Parametizer, BoolParam, StrParam, IntParam
-from avocado.events import usage
-from avocado.models import DataConcept, DataCategory
+from serrano import usage
+from avocado.models import DataConcept, DataCategory, DataConceptField
 from avocado.conf import OPTIONAL_DEPS
+from serrano import catalog
+from serrano.links import get_links
+from serrano.orphans import get_orphaned_concepts
+from serrano.validation import chunked, get_chunk_size
 from serrano.resources.field import FieldResource
 from .base import ThrottledResource, SAFE_METHODS
 from . import templates
-from .field import base as FieldResources
 
 can_change_concept = lambda u: u.has_perm('avocado.change_dataconcept')
-log = logging.getLogger(__name__)
 
 
 def has_orphaned_field(instance):
-    has_orphan = False
-    for field in instance.fields.iterator():
-        if FieldResources.is_field_orphaned(field):
-            log.error('Concept has orphaned field.',
-                      extra={
-                          'concept': instance.pk,
-                          'field': field.pk
-                      })
-            has_orphan = True
-    return has_orphan
-
-
-def concept_posthook(instance, data, request, embed, brief, categories=None):
+    return instance.pk in get_orphaned_concepts([instance.pk])
+
+
+def concept_posthook(instance, data, request, embed, brief, categories=None,
+                     fields=None):
     """Concept serialization post-hook for augmenting per-instance data.
 
     The only two arguments the post-hook takes is instance and data. The
     remaining arguments must be partially applied using `functools.partial`
     during the request/response cycle.
     """
-    uri = request.build_absolute_uri
-
     if categories is None:
         categories = {}
 
@@ -61,20 +53,25 @@ def concept_posthook(instance, data, request, embed, brief, categories=None):
                 data['category']['parent'].pop('parent_id')
 
     if not brief:
+        links = get_links(request)
+
         data['_links'] = {
             'self': {
-                'href': uri(reverse('serrano:concept', args=[instance.pk])),
+                'href': links('serrano:concept', instance.pk),
             },
             'fields': {
-                'href': uri(
-                    reverse('serrano:concept-fields', args=[instance.pk])),
+                'href': links('serrano:concept-fields', instance.pk),
             }
         }
 
-    # Embeds the related fields directly in the concept output
+    # Embeds the related fields directly in the concept output. These are
+    # passed in as a dict keyed by the concept's primary key when prefetched.
     if not brief and embed:
-        resource = ConceptFieldsResource()
-        data['fields'] = resource.prepare(request, instance)
+        if fields is not None:
+            data['fields'] = fields.get(instance.pk, [])
+        else:
+            resource = ConceptFieldsResource()
+            data['fields'] = resource.prepare(request, instance)
 
     return data
 
@@ -123,6 +120,36 @@ class ConceptBase(ThrottledResource):
         """
         return dict((x.pk, x) for x in list(DataCategory.objects.all()))
 
+    def _get_fields(self, request, concepts):
+        """Returns a dict of the serialized fields of each concept.
+
+        The concept fields are read in a single query rather than one per
+        concept and each field is serialized once, even if it is shared by
+        multiple concepts.
+        """
+        resource = FieldResource()
+        template = templates.ConceptField
+
+        serialized = {}
+        fields = defaultdict(list)
+
+        queryset = DataConceptField.objects.select_related('field')
+        pks = [c.pk for c in concepts]
+
+        for chunk in chunked(pks, get_chunk_size(queryset.db)):
+            for cf in queryset.filter(concept__in=chunk).iterator():
+                if cf.field_id not in serialized:
+                    serialized[cf.field_id] = resource.prepare(
+                        request, cf.field)
+
+                # Copy since the alternate names are specific to the
+                # relationship between the concept and the field.
+                field = deepcopy(serialized[cf.field_id])
+                field.update(serialize(cf, **template))
+                fields[cf.concept_id].append(field)
+
+        return fields
+
     def prepare(self, request, objects, template=None, embed=False,
                 brief=False, **params):
 
@@ -134,9 +161,18 @@ class ConceptBase(ThrottledResource):
         else:
             categories = self._get_categories(request, objects)
 
+        fields = None
+
+        if embed and not brief:
+            if isinstance(objects, self.model):
+                fields = self._get_fields(request, [objects])
+            else:
+                objects = list(objects)
+                fields = self._get_fields(request, objects)
+
         posthook = functools.partial(
             concept_posthook, request=request, embed=embed, brief=brief,
-            categories=categories)
+            categories=categories, fields=fields)
 
         return serialize(objects, posthook=posthook, **template)
 
@@ -208,6 +244,22 @@ class ConceptsResource(ConceptBase):
     def get(self, request, pk=None):
         params = self.get_params(request)
 
+        # Search results are not cached
+        if params['query'] and OPTIONAL_DEPS['haystack']:
+            return self.get_collection(request, params)
+
+        data = {
+            'params': params,
+            'change': can_change_concept(request.user),
+            'orphans': self.checks_for_orphans,
+        }
+
+        return catalog.get_or_prepare(
+            request, 'concepts', data,
+            lambda: self.get_collection(request, params))
+
+    def get_collection(self, request, params):
+        "Returns the serialized concepts for the request."
         queryset = self.get_queryset(request)
 
         # For privileged users, check if any filters are applied, otherwise
@@ -243,11 +295,9 @@ class ConceptsResource(ConceptBase):
             objects = queryset
 
         if self.checks_for_orphans and params['embed']:
-            pks = []
-            for obj in objects:
-                if not has_orphaned_field(obj):
-                    pks.append(obj.pk)
-            objects = self.model.objects.filter(pk__in=pks)
+            objects = list(objects)
+            orphaned = get_orphaned_concepts([obj.pk for obj in objects])
+            objects = [obj for obj in objects if obj.pk not in orphaned]
 
         return self.prepare(request, objects, **params)
 
@@ -1,15 +1,15 @@
 import functools
 import logging
-from datetime import datetime
 from django.http import HttpResponse
 from django.conf.urls import patterns, url
-from django.core.urlresolvers import reverse
 from django.views.decorators.cache import never_cache
 from restlib2.http import codes
-from preserialize.serialize import serialize
-from avocado.events import usage
+from serrano.serializers import serialize
+from serrano import usage
 from avocado.models import DataContext
 from serrano.forms import ContextForm
+from serrano import access
+from serrano.links import get_links
 from .base import ThrottledResource
 from .history import RevisionsResource, ObjectRevisionsResource, \
     ObjectRevisionResource
@@ -19,7 +19,7 @@ log = logging.getLogger(__name__)
 
 
 def context_posthook(instance, data, request):
-    uri = request.build_absolute_uri
+    links = get_links(request)
 
     # If this context is explicitly tied to a model (via the `count`)
     # specify the object names.
@@ -30,8 +30,7 @@ def context_posthook(instance, data, request):
 
     data['_links'] = {
         'self': {
-            'href': uri(
-                reverse('serrano:contexts:single', args=[instance.pk])),
+            'href': links('serrano:contexts:single', instance.pk),
         }
     }
     return data
@@ -135,8 +134,7 @@ class ContextResource(ContextBase):
 
     def get(self, request, **kwargs):
         usage.log('read', instance=request.instance, request=request)
-        self.model.objects.filter(pk=request.instance.pk).update(
-            accessed=datetime.now())
+        access.touch(request.instance)
         return self.prepare(request, request.instance)
 
     def put(self, request, **kwargs):
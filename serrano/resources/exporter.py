@@ -1,14 +1,28 @@
-from serrano.resources import API_VERSION
+import os
 from datetime import datetime
+from serrano.resources import API_VERSION
+from django.conf import settings
+from django.core.servers.basehttp import FileWrapper
 from django.http import HttpResponse, Http404
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # Django 1.4 does not have streaming responses, a regular one is used
+    StreamingHttpResponse = HttpResponse
 from django.conf.urls import patterns, url
 from django.core.urlresolvers import reverse
-from restlib2.params import Parametizer, IntParam, StrParam
+from restlib2.http import codes
+from restlib2.params import Parametizer, IntParam, StrParam, BoolParam
 from modeltree.tree import MODELTREE_DEFAULT_ALIAS, trees
 from avocado.export import registry as exporters
 from avocado.query import pipeline
-from avocado.events import usage
+from serrano import usage
+from serrano import jobs
+from serrano.export import stream_export, can_stream, can_shard, \
+    sharded_export
 from .base import BaseResource
+from .pagination import get_order_fields, get_order_by, decode_cursor, \
+    apply_cursor, get_iterable
 
 # Single list of all registered exporters
 EXPORT_TYPES = zip(*exporters.choices)[0]
@@ -41,9 +55,18 @@ class ExporterRootResource(BaseResource):
 class ExporterParametizer(Parametizer):
     limit = IntParam(50)
     tree = StrParam(MODELTREE_DEFAULT_ALIAS, choices=trees)
+    stream = BoolParam()
+    parallel = BoolParam()
+    cursor = StrParam()
 
 
 class ExporterResource(BaseResource):
+    """Exporter Resource
+
+    If `stream` is true, the export is sent as it is written rather than
+    buffered in the response. This applies to the CSV and JSON exports
+    only, other formats are always buffered.
+    """
     cache_max_age = 0
 
     private_cache = True
@@ -51,18 +74,28 @@ class ExporterResource(BaseResource):
     parametizer = ExporterParametizer
 
     def _export(self, request, export_type, view, context, **kwargs):
-        # Handle an explicit export type to a file
-        resp = HttpResponse()
-
         params = self.get_params(request)
 
         limit = params.get('limit')
         tree = params.get('tree')
+        stream = params.get('stream')
+        parallel = params.get('parallel')
+
+        if stream is None:
+            stream = getattr(settings, 'SERRANO_EXPORT_STREAMING', False)
+
+        if parallel is None:
+            parallel = getattr(settings, 'SERRANO_EXPORT_PARALLEL', False)
+
+        # Only formats written row by row are streamed, the others build
+        # the whole file before writing it.
+        stream = stream and can_stream(export_type)
 
         page = kwargs.get('page')
         stop_page = kwargs.get('stop_page')
 
         offset = None
+        cursor = None
 
         # Restrict export to a particular page or page range
         if page:
@@ -77,6 +110,16 @@ class ExporterResource(BaseResource):
             # Change to 0-base for calculating offset
             offset = limit * (page - 1)
 
+            # A cursor leading to this page can be used to seek to the first
+            # row rather than scanning past all the preceding rows.
+            order_fields = get_order_fields(view, tree)
+            cursor = decode_cursor(params.get('cursor'),
+                                   get_order_by(view, tree))
+
+            if (cursor is not None and
+                    (cursor['d'] != 'next' or cursor['o'] != offset)):
+                cursor = None
+
             if stop_page:
                 stop_page = int(stop_page)
 
@@ -100,10 +143,34 @@ class ExporterResource(BaseResource):
                                    include_pk=False)
 
         exporter = processor.get_exporter(exporters[export_type])
-        iterable = processor.get_iterable(offset=offset, limit=limit)
 
-        # Write the data to the response
-        exporter.write(iterable, resp, request=request)
+        def get_rows():
+            if cursor is not None:
+                queryset = apply_cursor(processor.get_queryset(), tree,
+                                        order_fields, cursor)
+                return get_iterable(queryset[:limit])
+            return processor.get_iterable(offset=offset, limit=limit)
+
+        # Full exports can be split across worker processes which each
+        # format a range of primary keys.
+        if parallel and page is None and can_shard(export_type, view, tree):
+            chunks = sharded_export(export_type, context, view, tree)
+
+            if stream:
+                resp = StreamingHttpResponse(chunks)
+            else:
+                resp = HttpResponse()
+                for chunk in chunks:
+                    resp.write(chunk)
+
+        # Stream the data as it is written rather than buffering the entire
+        # export in the response.
+        elif stream:
+            resp = StreamingHttpResponse(
+                stream_export(exporter, get_rows, request=request))
+        else:
+            resp = HttpResponse()
+            exporter.write(get_rows(), resp, request=request)
 
         filename = '{0}-{1}-data.{2}'.format(
             file_tag, datetime.now(), exporter.file_extension)
@@ -117,6 +184,8 @@ class ExporterResource(BaseResource):
         usage.log('export', request=request, data={
             'type': export_type,
             'partial': page is not None,
+            'streamed': stream,
+            'parallel': parallel,
         })
 
         return resp
@@ -133,13 +202,136 @@ class ExporterResource(BaseResource):
     post = get
 
 
+def job_data(request, job):
+    "Returns the representation of an export job."
+    uri = request.build_absolute_uri
+
+    data = {
+        'id': job.id,
+        'type': job.export_type,
+        'status': job.status,
+        'rows': job.rows,
+        'total': job.total,
+        'percent': job.percent,
+        'created': job.created,
+        'finished': job.finished,
+        '_links': {
+            'self': {
+                'href': uri(reverse('serrano:data:exporter-job',
+                                    kwargs={'job_id': job.id})),
+            },
+        }
+    }
+
+    if job.status == jobs.COMPLETE:
+        data['_links']['download'] = {
+            'href': uri(reverse('serrano:data:exporter-job-download',
+                                kwargs={'job_id': job.id})),
+        }
+    elif job.status == jobs.FAILED:
+        data['error'] = job.error
+
+    return data
+
+
+class ExporterJobsResource(BaseResource):
+    """Resource for queuing an export to run in the background.
+
+    The export is written to disk by the local worker pool and the returned
+    job can be polled for progress.
+    """
+    cache_max_age = 0
+
+    private_cache = True
+
+    parametizer = ExporterParametizer
+
+    def is_not_found(self, request, response, export_type, **kwargs):
+        return export_type not in EXPORT_TYPES
+
+    def post(self, request, export_type):
+        params = self.get_params(request)
+
+        view = self.get_view(request)
+        context = self.get_context(request)
+
+        job = jobs.enqueue(request, export_type, context, view,
+                           tree=params.get('tree'))
+
+        usage.log('export', request=request, data={
+            'type': export_type,
+            'partial': False,
+            'job': job.id,
+        })
+
+        data = job_data(request, job)
+        resp = self.render(request, data, status=codes.accepted)
+        resp['Location'] = data['_links']['self']['href']
+        return resp
+
+
+class ExporterJobResource(BaseResource):
+    "Resource for polling the progress of an export job."
+    cache_max_age = 0
+
+    private_cache = True
+
+    def is_not_found(self, request, response, job_id):
+        job = jobs.ExportJob.load(job_id)
+
+        # Jobs are only visible to the user or session that created them
+        if job is None or not job.is_owner(request):
+            return True
+
+        request.job = job
+        return False
+
+    def get(self, request, job_id):
+        # Ensure the workers are running in this process to pick up jobs
+        # that were queued prior to a restart.
+        jobs.start_workers()
+        return job_data(request, request.job)
+
+
+class ExporterJobDownloadResource(ExporterJobResource):
+    "Resource for downloading the file of a completed export job."
+
+    def get(self, request, job_id):
+        job = request.job
+
+        if job.status != jobs.COMPLETE:
+            return HttpResponse(status=codes.conflict)
+
+        exporter = exporters[job.export_type]
+
+        resp = StreamingHttpResponse(FileWrapper(open(job.file_path, 'rb')))
+
+        filename = 'all-{0}-data.{1}'.format(job.finished,
+                                             exporter.file_extension)
+        resp['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+            filename)
+        resp['Content-Type'] = exporter.content_type
+        resp['Content-Length'] = os.path.getsize(job.file_path)
+
+        return resp
+
+
 exporter_resource = ExporterResource()
 exporter_root_resource = ExporterRootResource()
+exporter_jobs_resource = ExporterJobsResource()
+exporter_job_resource = ExporterJobResource()
+exporter_job_download_resource = ExporterJobDownloadResource()
 
 # Resource endpoints
 urlpatterns = patterns(
     '',
     url(r'^$', exporter_root_resource, name='exporter'),
+    url(r'^jobs/(?P<job_id>\w+)/$', exporter_job_resource,
+        name='exporter-job'),
+    url(r'^jobs/(?P<job_id>\w+)/download/$', exporter_job_download_resource,
+        name='exporter-job-download'),
+    url(r'^(?P<export_type>\w+)/jobs/$', exporter_jobs_resource,
+        name='exporter-jobs'),
     url(r'^(?P<export_type>\w+)/$', exporter_resource, name='exporter'),
     url(r'^(?P<export_type>\w+)/(?P<page>\d+)/$', exporter_resource,
         name='exporter'),
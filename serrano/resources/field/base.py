@@ -1,13 +1,15 @@
 import functools
 import logging
 from django.http import HttpResponse
-from django.core.urlresolvers import reverse
-from preserialize.serialize import serialize
+from serrano.serializers import serialize
 from restlib2.http import codes
 from restlib2.params import Parametizer, StrParam, BoolParam, IntParam
 from avocado.conf import OPTIONAL_DEPS
 from avocado.models import DataField
-from avocado.events import usage
+from serrano import usage
+from serrano import catalog
+from serrano.links import get_links
+from serrano.orphans import get_orphaned_fields
 from ..base import ThrottledResource
 from .. import templates
 
@@ -31,13 +33,12 @@ def field_posthook(instance, data, request):
     during the request/response cycle.
     """
 
-    uri = request.build_absolute_uri
+    links = get_links(request)
 
     # Augment the links
     data['_links'] = {
         'self': {
-            'href': uri(reverse('serrano:field',
-                        args=[instance.pk])),
+            'href': links('serrano:field', instance.pk),
         }
     }
 
@@ -47,18 +48,15 @@ def field_posthook(instance, data, request):
         data['orphaned'] = True
     else:
         data['_links']['values'] = {
-            'href': uri(reverse('serrano:field-values',
-                        args=[instance.pk])),
+            'href': links('serrano:field-values', instance.pk),
         }
         data['_links']['distribution'] = {
-            'href': uri(reverse('serrano:field-distribution',
-                        args=[instance.pk])),
+            'href': links('serrano:field-distribution', instance.pk),
         }
 
         if stats_capable(instance):
             data['_links']['stats'] = {
-                'href': uri(reverse('serrano:field-stats',
-                            args=[instance.pk])),
+                'href': links('serrano:field-stats', instance.pk),
             }
 
     return data
@@ -138,6 +136,23 @@ class FieldsResource(FieldResource):
 
     def get(self, request):
         params = self.get_params(request)
+
+        # Search results are not cached
+        if params['query'] and OPTIONAL_DEPS['haystack']:
+            return self.get_collection(request, params)
+
+        data = {
+            'params': params,
+            'change': can_change_field(request.user),
+            'orphans': self.checks_for_orphans,
+        }
+
+        return catalog.get_or_prepare(
+            request, 'fields', data,
+            lambda: self.get_collection(request, params))
+
+    def get_collection(self, request, params):
+        "Returns the serialized fields for the request."
         queryset = self.get_queryset(request)
 
         # For privileged users, check if any filters are applied, otherwise
@@ -153,6 +168,13 @@ class FieldsResource(FieldResource):
         else:
             queryset = queryset.published()
 
+        # Exclude orphaned fields up front rather than checking each field
+        if self.checks_for_orphans:
+            orphaned = get_orphaned_fields()
+
+            if orphaned:
+                queryset = queryset.exclude(pk__in=orphaned)
+
         # If Haystack is installed, perform the search
         if params['query'] and OPTIONAL_DEPS['haystack']:
             usage.log('search', model=self.model, request=request, data={
@@ -172,11 +194,4 @@ class FieldsResource(FieldResource):
 
             objects = queryset
 
-        if self.checks_for_orphans:
-            pks = []
-            for obj in objects:
-                if not is_field_orphaned(obj):
-                    pks.append(obj.pk)
-            objects = self.model.objects.filter(pk__in=pks)
-
         return self.prepare(request, objects, **params)
@@ -1,5 +1,7 @@
 import json
 from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
 from django.http import HttpResponse
 from restlib2.http import codes
@@ -7,13 +9,19 @@ from restlib2.params import Parametizer, StrParam, BoolParam, IntParam
 from modeltree.tree import MODELTREE_DEFAULT_ALIAS, trees
 from avocado.models import DataField
 from avocado.stats import kmeans
-from avocado.events import usage
+from serrano import usage
+from serrano import kmeans as vectorized
+from serrano import binning
+from serrano.cache import cache_key, data_version
 from .base import FieldBase
 
 
 MINIMUM_OBSERVATIONS = 500
 MAXIMUM_OBSERVATIONS = 50000
 
+# Default number of seconds distributions are cached for
+DIST_CACHE_TIMEOUT = 60 * 60
+
 
 class FieldDistParametizer(Parametizer):
     tree = StrParam(MODELTREE_DEFAULT_ALIAS, choices=trees)
@@ -22,13 +30,49 @@ class FieldDistParametizer(Parametizer):
     sort = StrParam()
     cluster = BoolParam(True)
     n = IntParam()
+    binning = StrParam(choices=binning.METHODS)
+    bins = IntParam()
 
 
 class FieldDistribution(FieldBase):
-    "Field Counts Resource"
+    """Field Counts Resource
+
+    For continuous fields, the `binning` parameter may be set to `width` or
+    `quantile` to count the rows per bucket in the database rather than per
+    distinct value. The number of buckets per dimension is set by `bins`.
+    Binning is also used when the number of distinct values exceeds the
+    maximum number of observations.
+
+    Results are cached for `SERRANO_DIST_CACHE_TIMEOUT` seconds keyed by the
+    parameters and the applied context. Entries are invalidated when the
+    data of any of the fields is modified.
+    """
 
     parametizer = FieldDistParametizer
 
+    def get_binned(self, request, instance, params, tree, queryset, fields,
+                   method):
+        bins = params['bins'] or getattr(settings, 'SERRANO_DIST_BINS',
+                                         binning.DEFAULT_BINS)
+
+        points = binning.binned_counts(tree, queryset, fields, method=method,
+                                       bins=max(1, bins))
+
+        usage.log('dist', instance=instance, request=request, data={
+            'size': len(points),
+            'clustered': False,
+            'binned': method,
+            'aware': params['aware'],
+        })
+
+        return {
+            'data': points,
+            'clustered': False,
+            'binned': method,
+            'outliers': [],
+            'size': len(points),
+        }
+
     def get(self, request, pk):
         instance = request.instance
         params = self.get_params(request)
@@ -70,6 +114,58 @@ class FieldDistribution(FieldBase):
             fields = [instance]
             groupby = [tree.query_string_for_field(instance.field)]
 
+        timeout = getattr(settings, 'SERRANO_DIST_CACHE_TIMEOUT',
+                          DIST_CACHE_TIMEOUT)
+
+        if timeout:
+            key = self.get_cache_key(params, context, fields)
+            resp = cache.get(key)
+
+            if resp is not None:
+                usage.log('dist', instance=instance, request=request, data={
+                    'size': resp['size'],
+                    'clustered': resp['clustered'],
+                    'aware': params['aware'],
+                    'cached': True,
+                })
+                return resp
+
+        resp = self.get_dist(request, instance, params, tree, tree_field,
+                             queryset, fields, groupby)
+
+        # Errors are returned as responses and are not cached
+        if timeout and isinstance(resp, dict):
+            cache.set(key, resp, timeout)
+
+        return resp
+
+    def get_cache_key(self, params, context, fields):
+        """Returns the cache key for the distribution.
+
+        The data version of the fields is included so the entry is
+        invalidated when the `data_version` of any field is incremented.
+        """
+        pks = [f.pk for f in fields]
+
+        data = {
+            'fields': pks,
+            'context': context.json,
+            'params': params,
+        }
+
+        version = data_version(DataField.objects.filter(pk__in=pks))
+        return cache_key('dist', data, version=version)
+
+    def get_dist(self, request, instance, params, tree, tree_field, queryset,
+                 fields, groupby):
+        numeric = all([d.simple_type == 'number' for d in fields])
+
+        # Continuous data can be counted per bucket by the database rather
+        # than grouping by every distinct value.
+        if numeric and params['binning']:
+            return self.get_binned(request, instance, params, tree, queryset,
+                                   fields, params['binning'])
+
         # Perform a count aggregation of the tree model grouped by the
         # specified dimensions
         stats = tree_field.count(*groupby)
@@ -93,8 +189,8 @@ class FieldDistribution(FieldBase):
             'size': 0,
         }
 
-        # Evaluate list of points
-        length = len(stats)
+        # Count the points in the database rather than loading them
+        length = stats._construct().count()
 
         # Nothing to do
         if not length:
@@ -106,6 +202,11 @@ class FieldDistribution(FieldBase):
             return resp
 
         if length > MAXIMUM_OBSERVATIONS:
+            if numeric and getattr(settings, 'SERRANO_DIST_AUTO_BINNING',
+                                   True):
+                return self.get_binned(request, instance, params, tree,
+                                       queryset, fields, binning.WIDTH)
+
             return HttpResponse(json.dumps({'error': 'Data too large'}),
                                 status=codes.unprocessable_entity)
 
@@ -119,12 +220,32 @@ class FieldDistribution(FieldBase):
             stats = stats.order_by('-count')
 
         clustered = False
-        points = list(stats)
         outliers = []
 
         # For N-dimensional continuous data, check if clustering should occur
         # to down-sample the data.
-        if all([d.simple_type == 'number' for d in fields]):
+        if numeric and (vectorized.available and
+                        getattr(settings, 'SERRANO_VECTORIZED_DISTRIBUTION',
+                                True)):
+            # Use the NumPy implementation if available. The rows are read
+            # into arrays of the observations and counts rather than a dict
+            # per point and the points are only built for the response. The
+            # aggregation's queryset is used to read the rows as tuples.
+            rows = stats._construct().values_list(*(groupby + ['count']))
+            obs, counts = vectorized.to_arrays(list(rows))
+
+            if params['cluster'] and length >= MINIMUM_OBSERVATIONS:
+                clustered = True
+
+                points, outliers = vectorized.weighted_counts(
+                    obs, counts, params['n'])
+            else:
+                indexes = vectorized.find_outliers(obs, normalized=False)
+                points, outliers = vectorized.split_outliers(obs, counts,
+                                                             indexes)
+        elif numeric:
+            points = list(stats)
+
             # Extract observations for clustering
             obs = []
             for point in points:
@@ -150,6 +271,8 @@ class FieldDistribution(FieldBase):
                     outliers.append(points[idx])
                     points[idx] = None
                 points = [p for p in points if p is not None]
+        else:
+            points = list(stats)
 
         usage.log('dist', instance=instance, request=request, data={
             'size': length,
@@ -1,41 +1,103 @@
-from django.core.urlresolvers import reverse
-from avocado.events import usage
-from .base import FieldBase
+from django.conf import settings
+from serrano import usage
+from serrano.links import get_links
+from serrano.stats import compute_stats, compute_batch_stats, get_stats, \
+    get_batch_stats
+from .base import FieldBase, is_field_orphaned, stats_capable
 
 
 class FieldStats(FieldBase):
-    "Field Stats Resource"
+    """Field Stats Resource
+
+    Stats are served from the stats store and only recomputed when the
+    field's data has been modified. Set `SERRANO_FIELD_STATS_STORE` to
+    False to always compute them against the live data.
+    """
 
     def get(self, request, pk):
-        uri = request.build_absolute_uri
+        links = get_links(request)
         instance = request.instance
 
-        if instance.simple_type == 'number':
-            stats = instance.max().min().avg()
-        elif (instance.simple_type == 'date' or
-              instance.simple_type == 'time' or
-              instance.simple_type == 'datetime'):
-            stats = instance.max().min()
-        else:
-            stats = instance.count(distinct=True)
-
-        if stats is None:
-            resp = {}
+        if getattr(settings, 'SERRANO_FIELD_STATS_STORE', True):
+            resp = get_stats(instance)
         else:
-            try:
-                resp = next(iter(stats))
-            except StopIteration:
-                resp = {}
+            resp = compute_stats(instance)
 
         resp['_links'] = {
             'self': {
-                'href': uri(
-                    reverse('serrano:field-stats', args=[instance.pk])),
+                'href': links('serrano:field-stats', instance.pk),
             },
             'parent': {
-                'href': uri(reverse('serrano:field', args=[instance.pk])),
+                'href': links('serrano:field', instance.pk),
             },
         }
 
         usage.log('stats', instance=instance, request=request)
         return resp
+
+
+class FieldsStats(FieldBase):
+    """Batch Field Stats Resource
+
+    Returns the stats for the fields supplied by the `ids` parameter keyed
+    by pk. The fields are grouped by model so the stats are computed with
+    one query per model rather than per field. Fields that do not exist,
+    are not visible to the user or do not support stats are ignored.
+    """
+
+    def is_not_found(self, request, response, *args, **kwargs):
+        return False
+
+    def get_pks(self, request):
+        if request.method == 'POST':
+            values = request.data
+        else:
+            values = request.GET.getlist('ids')
+
+        pks = []
+
+        if isinstance(values, list):
+            for value in values:
+                try:
+                    pks.append(int(value))
+                except (ValueError, TypeError):
+                    pass
+
+        return pks
+
+    def get(self, request):
+        links = get_links(request)
+
+        queryset = self.get_queryset(request).filter(pk__in=self.get_pks(
+            request))
+
+        instances = [f for f in queryset
+                     if stats_capable(f) and not is_field_orphaned(f)]
+
+        if getattr(settings, 'SERRANO_FIELD_STATS_STORE', True):
+            stats = get_batch_stats(instances)
+        else:
+            stats = compute_batch_stats(instances)
+
+        resp = {}
+
+        for instance in instances:
+            data = stats[instance.pk]
+            data['_links'] = {
+                'self': {
+                    'href': links('serrano:field-stats', instance.pk),
+                },
+                'parent': {
+                    'href': links('serrano:field', instance.pk),
+                },
+            }
+            resp[instance.pk] = data
+
+        usage.log('stats', model=self.model, request=request, data={
+            'fields': [f.pk for f in instances],
+        })
+
+        return resp
+
+    # POST mimics GET to support sending large lists of field ids
+    post = get
@@ -1,11 +1,25 @@
+from random import randint, sample, shuffle
+from django.db.models import Min, Max
 from django.http import HttpResponse
 from django.core.urlresolvers import reverse
+from django.utils.encoding import smart_unicode
 from restlib2.http import codes
 from restlib2.params import StrParam, IntParam, BoolParam
-from avocado.events import usage
+from serrano import usage
+from serrano.cache import cache_key
+from serrano.index import get_index
+from serrano.validation import chunked, get_chunk_size, validate_values
 from ..pagination import PaginatorResource, PaginatorParametizer
 from .base import FieldBase
 
+# Primary key types that can be sampled by drawing from the key range
+SAMPLE_PK_TYPES = ('AutoField', 'BigIntegerField', 'IntegerField',
+                   'PositiveIntegerField')
+
+# Number of times random keys are drawn before falling back to sorting the
+# table randomly, e.g. if the keys are sparse
+SAMPLE_ATTEMPTS = 3
+
 
 class FieldValuesParametizer(PaginatorParametizer):
     limit = IntParam(10)
@@ -19,6 +33,11 @@ class FieldValues(FieldBase, PaginatorResource):
 
     This resource can be overriden for any field to use a more
     performant search implementation.
+
+    Values are paginated in the database using `get_values_queryset` and
+    only the labels of the requested page are read using `get_labels`.
+    `get_all_values` is not used for paginating, resources that override it
+    to change the values should override these methods instead.
     """
 
     parametizer = FieldValuesParametizer
@@ -43,13 +62,49 @@ class FieldValues(FieldBase, PaginatorResource):
             })
         return results
 
+    def get_values_queryset(self, request, instance):
+        """Returns a queryset of the distinct values for this field.
+
+        This is used to paginate the values in the database rather than
+        loading all of them with `get_all_values`.
+        """
+        return instance.values_list()
+
+    def get_labels(self, instance, values):
+        """Returns a dict of labels for the values.
+
+        Only the labels of `values` are read, in a single pass, rather than
+        the choices of the field. Other than lexicon and object set fields
+        the label is the unicoded value.
+        """
+        if instance.lexicon or instance.objectset:
+            # The values are the primary keys of the lexicon or object set
+            label_field = 'label' if instance.lexicon else 'name'
+            queryset = instance.model.objects.all()
+
+            labels = {}
+            for chunk in chunked(set(values), get_chunk_size(queryset.db)):
+                labels.update(queryset.filter(pk__in=chunk)
+                              .values_list('pk', label_field))
+        else:
+            labels = {}
+
+        return dict((value, labels.get(value, smart_unicode(value)))
+                    for value in values)
+
     def get_search_values(self, request, instance, query):
         """
         Performs a search on the underlying data for a field.
 
-        This method can be overridden to use an alternate search
-        implementation.
+        The field's value index is used if one is available, otherwise the
+        values are searched in the database. This method can be overridden
+        to use an alternate search implementation.
         """
+        index = get_index(instance)
+
+        if index is not None:
+            return index.search(query)
+
         results = []
         for value in instance.search(query):
             results.append({
@@ -58,16 +113,64 @@ class FieldValues(FieldBase, PaginatorResource):
             })
         return results
 
+    def sample_values(self, instance, size):
+        """Returns up to `size` values of randomly chosen rows.
+
+        For integer primary keys, random keys are drawn from the key range
+        which avoids sorting the whole table. If too few rows exist for the
+        drawn keys, the rows are sorted randomly instead.
+        """
+        queryset = instance.model.objects.all()
+        pk = instance.model._meta.pk
+
+        if pk.get_internal_type() in SAMPLE_PK_TYPES:
+            bounds = queryset.aggregate(lo=Min(pk.name), hi=Max(pk.name))
+            lo, hi = bounds['lo'], bounds['hi']
+
+            if lo is None:
+                return []
+
+            span = hi - lo + 1
+            limit = get_chunk_size(queryset.db)
+            drawn = set()
+            values = []
+
+            for i in xrange(SAMPLE_ATTEMPTS):
+                needed = size - len(values)
+
+                # Draw extra keys to account for gaps
+                count = min(needed * 2, span - len(drawn), limit)
+                keys = set()
+                while len(keys) < count:
+                    key = randint(lo, hi)
+                    if key not in drawn:
+                        keys.add(key)
+                drawn.update(keys)
+
+                # The rows are returned in key order, so they are sampled
+                # rather than sliced to not favor lower keys
+                found = list(queryset.filter(pk__in=keys)
+                             .values_list(instance.field_name, flat=True))
+
+                if len(found) > needed:
+                    found = sample(found, needed)
+
+                values.extend(found)
+
+                # Stop if enough values were found or every key was drawn
+                if len(values) >= size or len(drawn) >= span:
+                    shuffle(values)
+                    return values
+
+        return list(queryset.order_by('?')
+                    .values_list(instance.field_name, flat=True)[:size])
+
     def get_random_values(self, request, instance, random):
         """Returns a random set of values. This is useful for pre-populating
         documents or form fields with example data.
         """
-        queryset = instance.model.objects.only(instance.field_name)\
-            .order_by('?')[:random]
-
         results = []
-        for obj in queryset:
-            value = getattr(obj, instance.field_name)
+        for value in self.sample_values(instance, random):
             results.append({
                 'label': instance.get_label(value),
                 'value': value,
@@ -90,15 +193,28 @@ class FieldValues(FieldBase, PaginatorResource):
                 'query': params['query'],
             })
             values = self.get_search_values(request, instance, params['query'])
+
+            paginator = self.get_paginator(values, limit=limit)
+            page = paginator.page(page)
         else:
-            values = self.get_all_values(request, instance)
+            # Only the values and labels for the requested page are read
+            # from the database.
+            queryset = self.get_values_queryset(request, instance)
+
+            count_key = cache_key('values_count', instance.pk,
+                                  version=instance.data_version)
 
-        # No page specified, return everything
-        if page is None:
-            return values
+            paginator = self.get_paginator(queryset, limit=limit,
+                                           count_key=count_key)
+            page = paginator.page(page)
 
-        paginator = self.get_paginator(values, limit=limit)
-        page = paginator.page(page)
+            objects = list(page.object_list)
+            labels = self.get_labels(instance, objects)
+
+            page.object_list = [{
+                'label': labels[value],
+                'value': value,
+            } for value in objects]
 
         path = reverse('serrano:field-values', kwargs={'pk': pk})
         links = self.get_page_links(request, path, page, extra=params)
@@ -130,19 +246,21 @@ class FieldValues(FieldBase, PaginatorResource):
             return HttpResponse('Error parsing value',
                                 status=codes.unprocessable_entity)
 
-        field_name = instance.field_name
-
         # Note, this return a context-aware or naive queryset depending
         # on params
         queryset = self.get_base_values(request, instance, params)
-        lookup = {'{0}__in'.format(field_name): values}
 
-        results = set(queryset.filter(**lookup)
-                      .values_list(field_name, flat=True))
+        # Valid values are only cached for the naive queryset since the
+        # context-aware one may differ per request.
+        results = validate_values(instance, queryset, values,
+                                  cache=not params['aware'])
+
+        labels = self.get_labels(instance, [datum['value'] for datum in array
+                                            if 'label' not in datum])
 
         for datum in array:
             if 'label' not in datum:
-                datum['label'] = instance.get_label(datum['value'])
+                datum['label'] = labels[datum['value']]
             datum['valid'] = datum['value'] in results
 
         usage.log('validate', instance=instance, request=request, data={
@@ -1,9 +1,9 @@
 import functools
 from django.contrib.contenttypes.models import ContentType
-from django.core.urlresolvers import reverse
-from preserialize.serialize import serialize
+from serrano.serializers import serialize
 from restlib2.params import Parametizer, BoolParam
 from avocado.history.models import Revision
+from serrano.links import get_links
 from .base import ThrottledResource
 from . import templates
 
@@ -13,16 +13,16 @@ __all__ = ('RevisionParametizer', 'RevisionsResource',
 
 def revision_posthook(instance, data, request, object_uri, object_template,
                       embed=False):
-    uri = request.build_absolute_uri
+    links = get_links(request)
 
     data['_links'] = {
         'self': {
-            'href': uri(reverse("{0}:revision_for_object".format(object_uri),
-                                args=[instance.object_id, instance.pk])),
+            'href': links("{0}:revision_for_object".format(object_uri),
+                          instance.object_id, instance.pk),
         },
         'object': {
-            'href': uri(reverse("{0}:single".format(object_uri),
-                                args=[instance.object_id])),
+            'href': links("{0}:single".format(object_uri),
+                          instance.object_id),
         }
     }
 
@@ -1,8 +1,27 @@
+import re
+import json
+import base64
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from modeltree.tree import trees
 from restlib2.params import Parametizer, IntParam
 from restlib2.resources import Resource
 
-__all__ = ('PaginatorResource', 'PaginatorParametizer')
+__all__ = ('PaginatorResource', 'PaginatorParametizer', 'CountPaginator')
+
+# Default number of seconds counts are cached for
+COUNT_CACHE_TIMEOUT = 60 * 60
+
+# Planner estimates below this are not reliable enough to be used in place
+# of an exact count, which is cheap for small results anyway.
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Backends which sort NULLs after all other values in ascending order
+NULLS_LARGEST = ('postgresql', 'oracle')
 
 
 class PaginatorParametizer(Parametizer):
@@ -10,14 +29,288 @@ class PaginatorParametizer(Parametizer):
     limit = IntParam(20)
 
 
+class CountPaginator(Paginator):
+    "Paginator that uses a precomputed count rather than counting the objects."
+    def __init__(self, object_list, per_page, count, estimated=False,
+                 **kwargs):
+        super(CountPaginator, self).__init__(object_list, per_page, **kwargs)
+        self._precomputed_count = count
+        self.estimated = estimated
+
+    @property
+    def count(self):
+        return self._precomputed_count
+
+
+def estimate_count(queryset):
+    """Returns the planner's estimate of the number of rows for `queryset`.
+
+    This is only supported for PostgreSQL, None is returned for other
+    backends or if the estimate could not be read from the plan.
+    """
+    conn = connections[queryset.db]
+
+    if conn.vendor != 'postgresql':
+        return
+
+    sql, params = queryset.query.sql_with_params()
+
+    cursor = conn.cursor()
+    cursor.execute('EXPLAIN {0}'.format(sql), params)
+    row = cursor.fetchone()
+
+    if row:
+        match = re.search(r'rows=(\d+)', row[0])
+        if match:
+            return int(match.group(1))
+
+
+def get_count(queryset, key=None):
+    """Returns a tuple of the count for `queryset` and whether it is an
+    estimate.
+
+    If `key` is supplied the count is cached for
+    `SERRANO_COUNT_CACHE_TIMEOUT` seconds. If `SERRANO_ESTIMATE_COUNTS` is
+    enabled, the planner's estimate is used for large results.
+    """
+    timeout = getattr(settings, 'SERRANO_COUNT_CACHE_TIMEOUT',
+                      COUNT_CACHE_TIMEOUT)
+
+    if key and timeout:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    count = None
+    estimated = False
+
+    if getattr(settings, 'SERRANO_ESTIMATE_COUNTS', False):
+        estimate = estimate_count(queryset)
+        threshold = getattr(settings, 'SERRANO_ESTIMATED_COUNT_THRESHOLD',
+                            ESTIMATED_COUNT_THRESHOLD)
+
+        if estimate is not None and estimate >= threshold:
+            count = estimate
+            estimated = True
+
+    if count is None:
+        count = queryset.count()
+
+    if key and timeout:
+        cache.set(key, (count, estimated), timeout)
+
+    return count, estimated
+
+
+def get_order_fields(view, tree):
+    """Returns a list of model field and descending pairs the view is
+    ordered by.
+
+    The primary key of the tree's root model is appended as a tie-breaker
+    so the ordering is total which is required for keyset pagination.
+    """
+    node = view.parse(tree=tree)
+    fields = []
+
+    if node.ordering:
+        groups = node.get_fields_for_order_by()
+
+        for pk, direction in node.ordering:
+            for f in groups.get(pk, ()):
+                # Lexicon-based models are ordered by their `order` field
+                if f.lexicon:
+                    field = f.model._meta.get_field('order')
+                else:
+                    field = f.field
+
+                fields.append((field, direction.lower() == 'desc'))
+
+    fields.append((trees[tree].root_model._meta.pk, False))
+    return fields
+
+
+def get_order_by(view, tree):
+    "Returns the directional lookups the view is ordered by."
+    lookups = []
+
+    for field, desc in get_order_fields(view, tree):
+        lookup = trees[tree].query_string_for_field(field)
+
+        if desc:
+            lookup = '-' + lookup
+
+        lookups.append(lookup)
+
+    return lookups
+
+
+def _order_by_hash(order_by):
+    return hashlib.md5(','.join(order_by)).hexdigest()[:8]
+
+
+def encode_cursor(order_by, values, offset, direction):
+    """Returns an opaque token for the row with the ordering `values`.
+
+    The `offset` of the page the cursor leads to is included so the page
+    number can be reported and as a fallback if the cursor cannot be used.
+    """
+    data = {
+        'h': _order_by_hash(order_by),
+        'k': values,
+        'o': offset,
+        'd': direction,
+    }
+    token = base64.urlsafe_b64encode(json.dumps(data, cls=DjangoJSONEncoder))
+    return token.rstrip('=')
+
+
+def decode_cursor(token, order_by):
+    """Returns the decoded cursor or None if it is invalid.
+
+    Cursors are only valid for the ordering they were created with, this
+    prevents applying stale cursors after the view has changed.
+    """
+    if not token:
+        return
+
+    try:
+        token = str(token)
+        token += '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(token))
+    except (TypeError, ValueError, UnicodeError):
+        return
+
+    if not isinstance(data, dict):
+        return
+
+    if data.get('h') != _order_by_hash(order_by):
+        return
+
+    values = data.get('k')
+
+    # NULLs cannot be compared so these fallback to offset-based paging
+    if (not isinstance(values, list) or len(values) != len(order_by) or
+            None in values):
+        return
+
+    if data.get('d') not in ('next', 'prev'):
+        return
+
+    try:
+        data['o'] = max(0, int(data.get('o')))
+    except (ValueError, TypeError):
+        return
+
+    return data
+
+
+def select_order_fields(queryset, tree, fields):
+    """Appends the columns of the ordering `fields` to the selected columns.
+
+    Exporters only read the leading columns of each row, so the trailing
+    ordering values of the rows that were read can be used to build the
+    cursors to the adjacent pages.
+    """
+    clone = trees[tree].add_select(queryset=queryset, include_pk=False,
+                                   *[field for field, desc in fields])
+    clone.query.select = list(queryset.query.select) + \
+        list(clone.query.select)
+    return clone
+
+
+def apply_cursor(queryset, tree, fields, cursor):
+    """Filters and orders the queryset to the rows following the cursor.
+
+    The ordering columns are selected with `select_order_fields` and the
+    condition is applied to those columns directly. Filtering by lookups
+    would join to-many relationships a second time and compare the cursor
+    against any related row rather than the row being paged through.
+
+    For `prev` cursors the ordering is reversed, so the rows must be
+    reversed again after being read.
+    """
+    reverse = cursor['d'] == 'prev'
+
+    queryset = select_order_fields(queryset, tree, fields)
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    nulls_largest = connection.vendor in NULLS_LARGEST
+
+    columns = []
+    for select in queryset.query.select[-len(fields):]:
+        # Django 1.6+ wraps the column in a `SelectInfo` tuple
+        alias, column = getattr(select, 'col', select)
+        columns.append('{0}.{1}'.format(qn(alias), qn(column)))
+
+    where = []
+    params = []
+    equal = []
+    ordering = []
+
+    for (field, desc), column, value in zip(fields, columns, cursor['k']):
+        value = field.get_db_prep_value(field.to_python(value), connection)
+
+        # Rows after the cursor are greater for ascending columns and less
+        # for descending columns. This flips when seeking backwards.
+        op = '<' if desc != reverse else '>'
+
+        condition = '{0} {1} %s'.format(column, op)
+
+        # NULLs are not comparable, but are read after the cursor when they
+        # sort after the other values in this direction
+        if (op == '>') == nulls_largest:
+            condition = '({0} OR {1} IS NULL)'.format(condition, column)
+
+        where.append(' AND '.join(
+            ['{0} = %s'.format(c) for c, v in equal] + [condition]))
+        params.extend([v for c, v in equal] + [value])
+
+        equal.append((column, value))
+
+        lookup = trees[tree].query_string_for_field(field)
+
+        if desc != reverse:
+            ordering.append('-' + lookup)
+        else:
+            ordering.append(lookup)
+
+    where = ' OR '.join(['({0})'.format(w) for w in where])
+
+    return queryset.extra(where=[where], params=params).order_by(*ordering)
+
+
+def get_iterable(queryset):
+    "Returns an iterable of rows for an exporter."
+    # ModelTreeQuerySet has a raw method defined, but fallback
+    # to the creating a results iter if not present.
+    if hasattr(queryset, 'raw'):
+        return queryset.raw()
+    compiler = queryset.query.get_compiler(queryset.db)
+    return compiler.results_iter()
+
+
 class PaginatorResource(Resource):
     parametizer = PaginatorParametizer
 
-    def get_paginator(self, queryset, limit):
-        return Paginator(queryset, per_page=limit)
+    def get_paginator(self, queryset, limit, count_key=None):
+        """Returns a paginator for the queryset.
+
+        If `count_key` is supplied, the count is read from or stored in the
+        cache under that key rather than counted for every page.
+        """
+        if count_key is None:
+            return Paginator(queryset, per_page=limit)
 
-    def get_page_links(self, request, path, page, extra=None):
-        "Returns the page links."
+        count, estimated = get_count(queryset, key=count_key)
+        return CountPaginator(queryset, per_page=limit, count=count,
+                              estimated=estimated)
+
+    def get_page_links(self, request, path, page, extra=None, cursors=None):
+        """Returns the page links.
+
+        If `cursors` are supplied, the `prev` and `next` links will include
+        the corresponding cursor token for keyset pagination.
+        """
         uri = request.build_absolute_uri
 
         # format string will be expanded below
@@ -28,6 +321,10 @@ class PaginatorResource(Resource):
 
         if extra:
             for key, value in extra.items():
+                # Cursors are specific to each link
+                if key == 'cursor':
+                    continue
+
                 # Use the original GET parameter if supplied and if the
                 # cleaned value is valid
                 if key in request.GET and value is not None and value != '':
@@ -40,6 +337,9 @@ class PaginatorResource(Resource):
         # Create path string
         path_format = '{0}?{1}'.format(path, '&'.join(pairs))
 
+        if cursors is None:
+            cursors = {}
+
         limit = page.paginator.per_page
 
         links = {
@@ -52,15 +352,19 @@ class PaginatorResource(Resource):
         }
 
         if page.has_previous():
+            href = path_format.format(page.previous_page_number(), limit)
+            if cursors.get('prev'):
+                href = '{0}&cursor={1}'.format(href, cursors['prev'])
             links['prev'] = {
-                'href': uri(
-                    path_format.format(page.previous_page_number(), limit)),
+                'href': uri(href),
             }
 
         if page.has_next():
+            href = path_format.format(page.next_page_number(), limit)
+            if cursors.get('next'):
+                href = '{0}&cursor={1}'.format(href, cursors['next'])
             links['next'] = {
-                'href': uri(
-                    path_format.format(page.next_page_number(), limit)),
+                'href': uri(href),
             }
 
         return links
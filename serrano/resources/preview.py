@@ -8,12 +8,16 @@ from modeltree.tree import MODELTREE_DEFAULT_ALIAS, trees
 from avocado.query import pipeline
 from avocado.export import HTMLExporter
 from restlib2.params import StrParam
+from serrano.cache import cache_key
 from .base import BaseResource
-from .pagination import PaginatorResource, PaginatorParametizer
+from .pagination import PaginatorResource, PaginatorParametizer, \
+    get_order_fields, get_order_by, decode_cursor, encode_cursor, \
+    apply_cursor, select_order_fields, get_iterable
 
 
 class PreviewParametizer(PaginatorParametizer):
     tree = StrParam(MODELTREE_DEFAULT_ALIAS, choices=trees)
+    cursor = StrParam()
 
 
 class PreviewResource(BaseResource, PaginatorResource):
@@ -22,6 +26,10 @@ class PreviewResource(BaseResource, PaginatorResource):
     Data is formatted using a JSON+HTML exporter which prefers HTML formatted
     or plain strings. Browser-based clients can consume the JSON and render
     the HTML for previewing.
+
+    The `prev` and `next` links include a cursor which seeks to the page
+    using the ordering of the boundary row rather than an offset, so deep
+    pages are as cheap to read as the first.
     """
 
     parametizer = PreviewParametizer
@@ -44,13 +52,57 @@ class PreviewResource(BaseResource, PaginatorResource):
         # Build a queryset for pagination and other downstream use
         queryset = processor.get_queryset(request=request)
 
+        # Resolve the cursor if one was supplied. It is only used if it
+        # is valid for the view's ordering.
+        order_fields = get_order_fields(view, tree)
+        order_by = get_order_by(view, tree)
+        cursor = decode_cursor(params.get('cursor'), order_by)
+
+        if cursor is not None:
+            page = cursor['o'] / limit + 1
+
+        if getattr(request, 'user', None) and request.user.is_authenticated():
+            owner = 'user:{0}'.format(request.user.pk)
+        else:
+            owner = 'session:{0}'.format(request.session.session_key)
+
+        # The count is cached relative to the query and the processor used
+        # since it is the most expensive part of paging through results.
+        # The processor receives the request and the queryset may depend on
+        # the user, so the count is only shared by requests of the same user
+        # or session.
+        count_key = cache_key('preview_count', {
+            'context': context.json,
+            'view': view.json,
+            'tree': tree,
+            'processor': '{0}.{1}'.format(QueryProcessor.__module__,
+                                          QueryProcessor.__name__),
+            'owner': owner,
+        })
+
         # Get paginator and page
-        paginator = self.get_paginator(queryset, limit=limit)
+        paginator = self.get_paginator(queryset, limit=limit,
+                                       count_key=count_key)
         page = paginator.page(page)
         offset = max(0, page.start_index() - 1)
 
-        # Prepare the exporter and iterable
-        iterable = processor.get_iterable(offset=offset, limit=limit)
+        # Seek to the page using the cursor if it leads to this page,
+        # otherwise fallback to the offset. In both cases the ordering
+        # values are selected after the exported columns so the cursors can
+        # be built from the first and last rows of the page. Offset-based
+        # pages use the same total ordering so rows with equal sort values
+        # are not skipped or repeated when switching to cursors.
+        if cursor is not None and cursor['o'] == offset:
+            rows = list(get_iterable(apply_cursor(
+                queryset, tree, order_fields, cursor)[:limit]))
+
+            # Rows before the cursor are read in reverse
+            if cursor['d'] == 'prev':
+                rows.reverse()
+        else:
+            rows = list(get_iterable(
+                select_order_fields(queryset, tree, order_fields)
+                .order_by(*order_by)[offset:offset + limit]))
 
         # Build up the header keys.
         # TODO: This is flawed since it assumes the output columns
@@ -73,7 +125,7 @@ class PreviewResource(BaseResource, PaginatorResource):
 
         objects = []
 
-        for row in exporter.read(iterable, request=request):
+        for row in exporter.read(rows, request=request):
             pk = None
             values = []
             for i, output in enumerate(row):
@@ -88,10 +140,27 @@ class PreviewResource(BaseResource, PaginatorResource):
         model_name = opts.verbose_name.format()
         model_name_plural = opts.verbose_name_plural.format()
 
+        # Cursors for the adjacent pages based on the boundary rows
+        cursors = {}
+
+        if rows:
+            size = len(order_by)
+            first, last = rows[0][-size:], rows[-1][-size:]
+
+            # NULLs cannot be compared, so these pages are read by offset
+            if page.has_previous() and None not in first:
+                cursors['prev'] = encode_cursor(
+                    order_by, list(first), max(0, offset - limit), 'prev')
+
+            if page.has_next() and None not in last:
+                cursors['next'] = encode_cursor(
+                    order_by, list(last), offset + limit, 'next')
+
         path = reverse('serrano:data:preview')
-        links = self.get_page_links(request, path, page, extra=params)
+        links = self.get_page_links(request, path, page, extra=params,
+                                    cursors=cursors)
 
-        return {
+        data = {
             'keys': header,
             'objects': objects,
             'object_name': model_name,
@@ -103,6 +172,11 @@ class PreviewResource(BaseResource, PaginatorResource):
             '_links': links,
         }
 
+        if paginator.estimated:
+            data['object_count_estimated'] = True
+
+        return data
+
     # POST mimics GET to support sending large request bodies for on-the-fly
     # context and view data.
     post = get
@@ -1,16 +1,16 @@
 import functools
 import logging
-from datetime import datetime
 from django.http import HttpResponse
 from django.conf.urls import patterns, url
-from django.core.urlresolvers import reverse
 from django.db.models import Q
 from django.views.decorators.cache import never_cache
 from restlib2.http import codes
-from preserialize.serialize import serialize
+from serrano.serializers import serialize
 from avocado.models import DataQuery
-from avocado.events import usage
+from serrano import usage
 from serrano import utils
+from serrano import access
+from serrano.links import get_links
 from serrano.forms import QueryForm
 from .base import ThrottledResource
 from .history import RevisionsResource, ObjectRevisionsResource, \
@@ -26,13 +26,13 @@ DELETE_QUERY_EMAIL_BODY = """The query named '{0}' has been deleted. You are
 
 
 def query_posthook(instance, data, request):
-    uri = request.build_absolute_uri
+    links = get_links(request)
     data['_links'] = {
         'self': {
-            'href': uri(reverse('serrano:queries:single', args=[instance.pk])),
+            'href': links('serrano:queries:single', instance.pk),
         },
         'forks': {
-            'href': uri(reverse('serrano:queries:forks', args=[instance.pk])),
+            'href': links('serrano:queries:forks', instance.pk),
         }
     }
 
@@ -48,14 +48,13 @@ def query_posthook(instance, data, request):
 
 
 def forked_query_posthook(instance, data, request):
-    uri = request.build_absolute_uri
+    links = get_links(request)
     data['_links'] = {
         'self': {
-            'href': uri(reverse('serrano:queries:single', args=[instance.pk])),
+            'href': links('serrano:queries:single', instance.pk),
         },
         'parent': {
-            'href': uri(reverse('serrano:queries:single',
-                        args=[instance.parent.pk])),
+            'href': links('serrano:queries:single', instance.parent.pk),
         }
     }
 
@@ -265,8 +264,7 @@ class QueryResource(QueryBase):
 
     def get(self, request, **kwargs):
         usage.log('read', instance=request.instance, request=request)
-        self.model.objects.filter(pk=request.instance.pk).update(
-            accessed=datetime.now())
+        access.touch(request.instance)
         return self.prepare(request, request.instance)
 
     def put(self, request, **kwargs):
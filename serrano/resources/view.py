@@ -1,15 +1,15 @@
 import functools
 import logging
-from datetime import datetime
 from django.http import HttpResponse
 from django.conf.urls import patterns, url
-from django.core.urlresolvers import reverse
 from django.views.decorators.cache import never_cache
 from restlib2.http import codes
-from preserialize.serialize import serialize
+from serrano.serializers import serialize
 from avocado.models import DataView
-from avocado.events import usage
+from serrano import usage
 from serrano.forms import ViewForm
+from serrano import access
+from serrano.links import get_links
 from .base import ThrottledResource
 from .history import RevisionsResource, ObjectRevisionsResource, \
     ObjectRevisionResource
@@ -19,10 +19,10 @@ log = logging.getLogger(__name__)
 
 
 def view_posthook(instance, data, request):
-    uri = request.build_absolute_uri
+    links = get_links(request)
     data['_links'] = {
         'self': {
-            'href': uri(reverse('serrano:views:single', args=[instance.pk])),
+            'href': links('serrano:views:single', instance.pk),
         }
     }
     return data
@@ -126,8 +126,7 @@ class ViewResource(ViewBase):
 
     def get(self, request, **kwargs):
         usage.log('read', instance=request.instance, request=request)
-        self.model.objects.filter(pk=request.instance.pk).update(
-            accessed=datetime.now())
+        access.touch(request.instance)
         return self.prepare(request, request.instance)
 
     def put(self, request, **kwargs):
@@ -0,0 +1,150 @@
+"""Compiled serializer templates.
+
+`preserialize.serialize` interprets the template options for every object
+being serialized. This compiles a template once per model into a serializer
+that has the selectors resolved and plain model fields read using attribute
+getters. Methods, properties and related objects are handled as they are by
+preserialize.
+
+`serialize` is a drop-in replacement for `preserialize.serialize`. Options
+that are not supported by compiled serializers fall back to preserialize.
+"""
+from operator import attrgetter
+from threading import Lock
+from django.db import models
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.query import QuerySet
+from preserialize import serialize as base
+from preserialize.utils import (get_field_value, parse_selectors,
+                                convert_to_camel)
+
+__all__ = ('serialize', 'get_serializer')
+
+# Options compiled serializers do not support
+UNSUPPORTED_OPTIONS = ('prehook', 'process', 'values_list', 'select_related')
+
+_serializers = {}
+_lock = Lock()
+
+
+def _freeze(value):
+    "Returns a hashable representation of the template options."
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class Serializer(object):
+    "Serializer compiled from a template for a model class."
+
+    def __init__(self, model, fields=None, exclude=None, **options):
+        # Items are the output aliases, not the raw accessors
+        aliases = parse_selectors(model, fields, exclude, **options)
+
+        options = base._defaults(options)
+
+        self.model = model
+        self.related = options['related']
+        self.entries = []
+
+        for alias in aliases:
+            accessor = options['aliases'].get(alias, alias)
+
+            key = options['prefix'] + alias
+            if options['camelcase']:
+                key = convert_to_camel(key)
+
+            self.entries.append((key, accessor, alias,
+                                 self._getter(accessor)))
+
+        self.allow_missing = options['allow_missing']
+
+    def _getter(self, accessor):
+        "Returns an attribute getter if the accessor is a plain model field."
+        try:
+            field = self.model._meta.get_field(accessor)
+        except FieldDoesNotExist:
+            return
+
+        # Relations and fields shadowed by a property use the generic path
+        if field.rel or field.attname != accessor or \
+                isinstance(getattr(self.model, accessor, None), property):
+            return
+
+        return attrgetter(accessor)
+
+    def _related(self, attrs, key, accessor, alias, value):
+        options = base._defaults(dict(self.related.get(accessor, {})))
+
+        if '%(accessor)s' in options['prefix']:
+            options['prefix'] = options['prefix'] % {'accessor': alias}
+
+        if isinstance(value, QuerySet):
+            attrs[key] = serialize(value, **options)
+        elif (len(options['fields']) == 1 and options['flat'] and
+                not options['merge']):
+            attrs[key] = list(serialize(value, **options).values())[0]
+        elif options['merge']:
+            attrs.update(serialize(value, **options))
+        else:
+            attrs[key] = serialize(value, **options)
+
+    def __call__(self, obj, posthook=None):
+        attrs = {}
+
+        for key, accessor, alias, getter in self.entries:
+            if getter is not None:
+                attrs[key] = getter(obj)
+                continue
+
+            value = get_field_value(obj, accessor,
+                                    allow_missing=self.allow_missing)
+
+            if isinstance(value, (models.Model, QuerySet)):
+                self._related(attrs, key, accessor, alias, value)
+            else:
+                attrs[key] = value
+
+        if posthook:
+            attrs = posthook(obj, attrs)
+
+        return attrs
+
+
+def get_serializer(model, options):
+    "Returns the compiled serializer for the model and template options."
+    key = (model, _freeze(options))
+    serializer = _serializers.get(key)
+
+    if serializer is None:
+        with _lock:
+            serializer = _serializers.get(key)
+
+            if serializer is None:
+                serializer = Serializer(model, **options)
+                _serializers[key] = serializer
+
+    return serializer
+
+
+def serialize(obj, posthook=None, **options):
+    """Serializes model instances and querysets using compiled templates.
+
+    Other objects and unsupported options are serialized by preserialize.
+    """
+    if any(options.get(key) for key in UNSUPPORTED_OPTIONS):
+        return base.serialize(obj, posthook=posthook, **options)
+
+    if isinstance(obj, models.Model):
+        return get_serializer(obj.__class__, options)(obj, posthook)
+
+    if isinstance(obj, QuerySet):
+        serializer = get_serializer(obj.model, options)
+        return [serializer(x, posthook) for x in obj]
+
+    if hasattr(obj, '__iter__') and not isinstance(obj, dict):
+        return [serialize(x, posthook=posthook, **options) for x in obj]
+
+    return base.serialize(obj, posthook=posthook, **options)
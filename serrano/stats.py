@@ -0,0 +1,197 @@
+import logging
+import multiprocessing
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Avg, Max, Min
+from avocado.models import DataField
+from .models import DataFieldStats
+
+__all__ = ('compute_stats', 'compute_batch_stats', 'get_stats',
+           'get_batch_stats', 'refresh_stats')
+
+log = logging.getLogger(__name__)
+
+
+def compute_stats(instance):
+    "Computes the stats for the field against the live data."
+    if instance.simple_type == 'number':
+        stats = instance.max().min().avg()
+    elif (instance.simple_type == 'date' or
+          instance.simple_type == 'time' or
+          instance.simple_type == 'datetime'):
+        stats = instance.max().min()
+    else:
+        stats = instance.count(distinct=True)
+
+    if stats is None:
+        return {}
+
+    try:
+        return dict(next(iter(stats)))
+    except StopIteration:
+        return {}
+
+
+def get_aggregates(instance):
+    """Returns the aggregates that make up the stats for the field.
+
+    These correspond to the aggregations performed by `compute_stats` and
+    apply to the field's `model`. For lexicon and object set fields this is
+    the lexicon or object set model rather than the model `field_name` is
+    defined on.
+    """
+    name = instance.field.name
+
+    if instance.simple_type == 'number':
+        return {'max': Max(name), 'min': Min(name), 'avg': Avg(name)}
+
+    if instance.simple_type in ('date', 'time', 'datetime'):
+        return {'max': Max(name), 'min': Min(name)}
+
+    return {'distinct_count': Count(name, distinct=True)}
+
+
+def compute_batch_stats(instances):
+    """Computes the stats for many fields, returns a dict keyed by pk.
+
+    Fields are grouped by their model and the aggregates for all fields of
+    a model are computed in a single query.
+    """
+    groups = OrderedDict()
+
+    for instance in instances:
+        groups.setdefault(instance.model, []).append(instance)
+
+    results = {}
+
+    for model, fields in groups.items():
+        aggregates = {}
+
+        for instance in fields:
+            for name, aggregate in get_aggregates(instance).items():
+                aggregates['{0}_{1}'.format(name, instance.pk)] = aggregate
+
+        row = model.objects.aggregate(**aggregates)
+
+        for instance in fields:
+            results[instance.pk] = dict(
+                (name, row['{0}_{1}'.format(name, instance.pk)])
+                for name in get_aggregates(instance))
+
+    return results
+
+
+def store_stats(instance, stats):
+    "Stores the stats for the field's current `data_version`."
+    store, created = DataFieldStats.objects.get_or_create(field=instance)
+    store.stats = stats
+    store.data_version = instance.data_version
+    store.save()
+    return store
+
+
+def get_stats(instance):
+    """Returns the stats for the field from the store.
+
+    The stats are computed and stored if they do not exist or the field's
+    data has been modified since they were computed.
+    """
+    try:
+        store = DataFieldStats.objects.get(field=instance)
+    except DataFieldStats.DoesNotExist:
+        store = None
+
+    if store is not None and not store.is_stale(instance):
+        return dict(store.stats)
+
+    stats = compute_stats(instance)
+    store_stats(instance, stats)
+    return stats
+
+
+def get_batch_stats(instances):
+    """Returns the stats for many fields from the store, keyed by pk.
+
+    Stats that are missing or stale are computed in one batch and stored.
+    """
+    stores = dict((store.field_id, store) for store in
+                  DataFieldStats.objects.filter(field__in=instances))
+
+    results = {}
+    stale = []
+
+    for instance in instances:
+        store = stores.get(instance.pk)
+
+        if store is not None and not store.is_stale(instance):
+            results[instance.pk] = dict(store.stats)
+        else:
+            stale.append(instance)
+
+    if stale:
+        computed = compute_batch_stats(stale)
+
+        for instance in stale:
+            store_stats(instance, computed[instance.pk])
+            results[instance.pk] = computed[instance.pk]
+
+    return results
+
+
+def _refresh(pk, force=False):
+    "Refreshes the stats for a single field, returns true if computed."
+    instance = DataField.objects.get(pk=pk)
+
+    if not force:
+        try:
+            store = DataFieldStats.objects.get(field=instance)
+            if not store.is_stale(instance):
+                return False
+        except DataFieldStats.DoesNotExist:
+            pass
+
+    store_stats(instance, compute_stats(instance))
+    return True
+
+
+def _refresh_star(args):
+    try:
+        return _refresh(*args)
+    except Exception:
+        log.exception('Error computing field stats', extra={'field': args[0]})
+        return False
+    finally:
+        connection.close()
+
+
+def refresh_stats(fields, force=False, processes=None):
+    """Computes and stores stats for the fields whose data has changed.
+
+    If `force` is true, stats are computed for all the fields. If more than
+    one process is used, the fields are computed in parallel by a pool of
+    worker processes. Returns the number of fields that were computed.
+    """
+    if processes is None:
+        processes = getattr(settings, 'SERRANO_STATS_PROCESSES', 1)
+
+    tasks = [(f.pk, force) for f in fields]
+
+    if processes <= 1 or len(tasks) <= 1:
+        return sum(1 for task in tasks if _refresh(*task))
+
+    # Connections must not be shared with the forked worker processes, each
+    # will open their own.
+    connection.close()
+
+    pool = multiprocessing.Pool(processes=processes)
+
+    try:
+        return sum(1 for computed in pool.imap_unordered(_refresh_star, tasks)
+                   if computed)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,183 @@
+"""Rate limiters for throttled resources.
+
+A limiter counts the requests made with a key, e.g. the user or session, and
+decides if the request exceeds `count` requests per `seconds`. The limiter is
+set with `SERRANO_RATE_LIMITER` as a dotted path to a `Limiter` subclass.
+
+`FixedWindowLimiter` (the default) and `SlidingWindowLimiter` store the counts
+in the cache and rely on the atomic increment of the cache backend, such as
+memcached, so concurrent requests are not under-counted. `LocalLimiter`
+keeps the counts in process and is suitable for single process deployments.
+"""
+import time
+from threading import Lock
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.importlib import import_module
+
+__all__ = ('Limiter', 'FixedWindowLimiter', 'SlidingWindowLimiter',
+           'LocalLimiter', 'get_limiter')
+
+DEFAULT_LIMITER = 'serrano.throttle.FixedWindowLimiter'
+
+_limiters = {}
+_lock = Lock()
+
+
+class Limiter(object):
+    "Base class for rate limiters."
+
+    def is_limited(self, key, count, seconds):
+        """Records a request for `key` and returns true if more than `count`
+        requests have been made within `seconds`.
+        """
+        raise NotImplementedError
+
+
+class CacheLimiter(Limiter):
+    "Base class for limiters that store the counts in the cache."
+
+    prefix = 'serrano:data_request:'
+
+    def incr(self, key, timeout):
+        """Increments the count for the key, creating it if it does not exist.
+
+        Returns None if the cache is unavailable, in which case requests are
+        not limited.
+        """
+        try:
+            return cache.incr(key)
+        except ValueError:
+            pass
+
+        if cache.add(key, 1, timeout):
+            return 1
+
+        # Another request created the key in the meantime, otherwise the
+        # cache cannot be reached
+        try:
+            return cache.incr(key)
+        except ValueError:
+            return None
+
+
+class FixedWindowLimiter(CacheLimiter):
+    """Counts requests within a window starting at the first request.
+
+    The count expires with the window, so a request only requires a single
+    increment unless a new window is started.
+    """
+
+    def is_limited(self, key, count, seconds):
+        current = self.incr(self.prefix + key, seconds)
+        return current is not None and current > count
+
+
+class SlidingWindowLimiter(CacheLimiter):
+    """Counts requests within a window sliding with the current time.
+
+    The count of the previous window is weighted by how much of it overlaps
+    the sliding window. This avoids allowing twice the requests at the
+    boundary between two fixed windows.
+
+    The previous window no longer changes once the current one has started,
+    so its count is read from the cache once per window and kept in process.
+    A request then only requires a single increment of the current window.
+    """
+
+    # Counts of previous windows are removed when this many keys are tracked
+    max_entries = 10000
+
+    def __init__(self):
+        self.previous = {}
+        self.lock = Lock()
+
+    def get_previous(self, key, window):
+        "Returns the count of the window preceding `window`."
+        entry = self.previous.get(key)
+
+        if entry is not None and entry[0] == window:
+            return entry[1]
+
+        count = cache.get('{0}{1}:{2}'.format(self.prefix, key,
+                                              window - 1)) or 0
+
+        with self.lock:
+            if len(self.previous) >= self.max_entries:
+                for k, (w, c) in self.previous.items():
+                    if w < window:
+                        del self.previous[k]
+
+            self.previous[key] = (window, count)
+
+        return count
+
+    def is_limited(self, key, count, seconds):
+        now = time.time()
+        window = int(now // seconds)
+
+        current = self.incr('{0}{1}:{2}'.format(self.prefix, key, window),
+                            seconds * 2)
+
+        if current is None:
+            return False
+
+        if current > count:
+            return True
+
+        weight = 1 - (now % seconds) / float(seconds)
+        return current + self.get_previous(key, window) * weight > count
+
+
+class LocalLimiter(Limiter):
+    """Counts requests within a window starting at the first request in
+    process.
+
+    Counts are not shared between processes, so this is only accurate for
+    single process deployments.
+    """
+
+    # Expired windows are removed when this many keys are tracked
+    max_entries = 10000
+
+    def __init__(self):
+        self.windows = {}
+        self.lock = Lock()
+
+    def prune(self, now):
+        for key, (current, expires) in self.windows.items():
+            if expires <= now:
+                del self.windows[key]
+
+    def is_limited(self, key, count, seconds):
+        now = time.time()
+
+        with self.lock:
+            window = self.windows.get(key)
+
+            if window is None or window[1] <= now:
+                if len(self.windows) >= self.max_entries:
+                    self.prune(now)
+
+                window = [0, now + seconds]
+                self.windows[key] = window
+
+            window[0] += 1
+            return window[0] > count
+
+
+def get_limiter():
+    "Returns the limiter set by `SERRANO_RATE_LIMITER`."
+    path = getattr(settings, 'SERRANO_RATE_LIMITER', DEFAULT_LIMITER)
+    limiter = _limiters.get(path)
+
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.get(path)
+
+            if limiter is None:
+                module, name = path.rsplit('.', 1)
+                limiter = getattr(import_module(module), name)()
+                _limiters[path] = limiter
+
+    return limiter
@@ -1,6 +1,13 @@
+import copy
 import hashlib
 import sys
+import time
 from datetime import datetime
+from threading import Lock
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
 from django.conf import settings
 from django.utils.http import int_to_base36, base36_to_int
 
@@ -89,3 +96,97 @@ class TokenGenerator(object):
 
 
 token_generator = TokenGenerator()
+
+# Default number of verified tokens that are cached
+TOKEN_CACHE_SIZE = 1000
+
+# Default number of seconds a verified token is cached for
+TOKEN_CACHE_TIMEOUT = 60
+
+
+class TokenCache(object):
+    """Bounded LRU cache of verified tokens and their users.
+
+    Entries expire after `SERRANO_TOKEN_CACHE_TIMEOUT` seconds or with the
+    token as determined by `SERRANO_TOKEN_TIMEOUT`, whichever is first. The
+    entries of a user are removed when the user is deleted, deactivated or
+    the password changes, which also invalidates the tokens. This only
+    applies to changes made in this process, changes made by other processes
+    take effect once the entries expire. The size is set by
+    `SERRANO_TOKEN_CACHE_SIZE`, with 0 disabling the cache.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    @property
+    def size(self):
+        return getattr(settings, 'SERRANO_TOKEN_CACHE_SIZE', TOKEN_CACHE_SIZE)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'SERRANO_TOKEN_CACHE_TIMEOUT',
+                       TOKEN_CACHE_TIMEOUT)
+
+    def get(self, token):
+        "Returns a copy of the user the token was verified for."
+        with self.lock:
+            entry = self.entries.pop(token, None)
+
+            if entry is None:
+                return
+
+            user, ts, cached = entry
+            now = token_generator._total_seconds(datetime.now())
+
+            if ((now - ts) > token_generator.timeout or
+                    time.time() - cached > self.timeout):
+                return
+
+            self.entries[token] = entry
+
+        # Copy so the cached user is not shared between requests
+        return copy.copy(user)
+
+    def set(self, token, user):
+        "Caches the user for a verified token."
+        if not self.size or not self.timeout:
+            return
+
+        ts = base36_to_int(token.split('-')[1])
+
+        with self.lock:
+            self.entries.pop(token, None)
+            self.entries[token] = (copy.copy(user), ts, time.time())
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user, deleted=False):
+        "Removes the entries of the user if the tokens are no longer valid."
+        with self.lock:
+            for token, (cached, ts, _) in self.entries.items():
+                if cached.pk != user.pk:
+                    continue
+
+                if (deleted or not user.is_active or
+                        cached.password != user.password):
+                    del self.entries[token]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def invalidate_tokens(sender, instance, **kwargs):
+    "Removes the cached tokens of a user that are no longer valid."
+    token_cache.invalidate(instance)
+
+
+def remove_tokens(sender, instance, **kwargs):
+    "Removes the cached tokens of a deleted user."
+    token_cache.invalidate(instance, deleted=True)
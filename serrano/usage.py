@@ -0,0 +1,196 @@
+"""Buffered usage event logging.
+
+`avocado.events.usage.log` saves each event with its own insert, which is
+done in the request or in a new thread per event. Events are instead put on
+a bounded in-process queue and saved with bulk inserts by a background thread
+once `SERRANO_USAGE_BATCH_SIZE` events are queued or every
+`SERRANO_USAGE_FLUSH_INTERVAL` seconds. Events are dropped rather than
+blocking the request if more than `SERRANO_USAGE_BUFFER_SIZE` are pending.
+The queue is drained when the process exits.
+
+Setting `SERRANO_USAGE_BUFFER` to False, or Avocado's `FORCE_SYNC_LOG` to
+True, logs using Avocado directly.
+"""
+import os
+import time
+import atexit
+import logging
+from Queue import Queue, Empty, Full
+from threading import Thread, Lock
+from datetime import datetime
+from django.conf import settings
+from django.db import connection
+from django.contrib.contenttypes.models import ContentType
+from avocado.conf import settings as avocado_settings
+from avocado.events import usage
+from avocado.events.models import Log
+
+__all__ = ('log', 'UsageBuffer', 'buffer')
+
+logger = logging.getLogger(__name__)
+
+# Default maximum number of events pending to be saved
+DEFAULT_BUFFER_SIZE = 10000
+
+# Default number of events saved per bulk insert
+DEFAULT_BATCH_SIZE = 500
+
+# Default maximum number of seconds an event is pending
+DEFAULT_FLUSH_INTERVAL = 5
+
+# Put on the queue to stop the worker
+_STOP = object()
+
+
+class UsageBuffer(object):
+    """Queue of usage events saved in bulk by a background thread.
+
+    `dropped` is the number of events that were not saved because the queue
+    was full or the insert failed, `flushed` is the number of events saved
+    and `backlog` is the number of events pending.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.dropped = 0
+        self.flushed = 0
+
+    @property
+    def backlog(self):
+        if self.queue is None:
+            return 0
+        return self.queue.qsize()
+
+    def start(self):
+        "Starts the worker if it is not running in this process."
+        with self.lock:
+            # The worker does not survive forking, so a new one is started
+            # in each process
+            if self.thread is not None and self.pid == os.getpid():
+                return
+
+            self.queue = Queue(getattr(settings, 'SERRANO_USAGE_BUFFER_SIZE',
+                                       DEFAULT_BUFFER_SIZE))
+            self.pid = os.getpid()
+
+            self.thread = Thread(target=self.run, args=(self.queue,),
+                                 name='serrano-usage')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self, timeout=None):
+        "Saves the pending events and stops the worker."
+        with self.lock:
+            thread, queue = self.thread, self.queue
+
+            if thread is None or self.pid != os.getpid():
+                return
+
+            self.thread = None
+
+        queue.put(_STOP, timeout=timeout)
+        thread.join(timeout)
+
+    def put(self, message):
+        "Queues the log message to be saved."
+        if self.thread is None or self.pid != os.getpid():
+            self.start()
+
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            with self.lock:
+                self.dropped += 1
+
+    def write(self, messages):
+        try:
+            Log.objects.bulk_create(messages)
+        except Exception:
+            logger.exception('Error logging usage')
+
+            with self.lock:
+                self.dropped += len(messages)
+        else:
+            with self.lock:
+                self.flushed += len(messages)
+        finally:
+            connection.close()
+
+    def run(self, queue):
+        batch_size = getattr(settings, 'SERRANO_USAGE_BATCH_SIZE',
+                             DEFAULT_BATCH_SIZE)
+        interval = getattr(settings, 'SERRANO_USAGE_FLUSH_INTERVAL',
+                           DEFAULT_FLUSH_INTERVAL)
+
+        stopped = False
+
+        while not stopped:
+            # Wait for the first event of the batch indefinitely
+            messages = [queue.get()]
+            deadline = time.time() + interval
+
+            # Nothing is queued after the stop marker, so the batch is saved
+            # immediately rather than at the end of the interval
+            while len(messages) < batch_size and messages[-1] is not _STOP:
+                timeout = deadline - time.time()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    messages.append(queue.get(timeout=timeout))
+                except Empty:
+                    break
+
+            if messages[-1] is _STOP:
+                messages.pop()
+                stopped = True
+
+            if messages:
+                self.write(messages)
+
+
+buffer = UsageBuffer()
+
+atexit.register(buffer.stop)
+
+
+def _message(event, instance=None, model=None, request=None, **kwargs):
+    "Returns an unsaved log message for the event."
+    kwargs['event'] = event
+
+    if request is not None:
+        if hasattr(request, 'user') and request.user.is_authenticated():
+            kwargs['user'] = request.user
+        if hasattr(request, 'session'):
+            kwargs['session_key'] = request.session.session_key
+
+    if 'timestamp' not in kwargs:
+        kwargs['timestamp'] = datetime.now()
+
+    if instance is not None:
+        kwargs['content_object'] = instance
+    elif model is not None:
+        kwargs['content_type'] = ContentType.objects.get_for_model(model)
+
+    return Log(**kwargs)
+
+
+def log(event, async=True, **kwargs):
+    """Logs an event with an optional associated object.
+
+    This takes the same arguments as `avocado.events.usage.log`.
+    """
+    if (not async or getattr(avocado_settings, 'FORCE_SYNC_LOG', False) or
+            not getattr(settings, 'SERRANO_USAGE_BUFFER', True)):
+        return usage.log(event, async=async, **kwargs)
+
+    try:
+        message = _message(event, **kwargs)
+    except Exception:
+        logger.exception('Error logging usage')
+    else:
+        buffer.put(message)
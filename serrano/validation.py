@@ -0,0 +1,123 @@
+"""Bulk validation of field values.
+
+Values are checked with `IN` lookups split into chunks that fit within the
+backend's parameter limit, along with the parameters of the queryset itself.
+Values known to be valid are remembered per field until the field's data is
+modified.
+"""
+from threading import Lock
+from django.conf import settings
+from django.db import connections
+from django.db.models.sql.datastructures import EmptyResultSet
+
+__all__ = ('chunked', 'validate_values')
+
+# Parameter limit used for backends that do not define one. This is the
+# SQLite default which is the lowest of the supported backends.
+DEFAULT_CHUNK_SIZE = 999
+
+# Maximum number of valid values remembered per field
+DEFAULT_CACHE_SIZE = 100000
+
+
+def get_chunk_size(using):
+    """Returns the maximum number of parameters of a query.
+
+    Django 1.5 does not expose the parameter limit of the backend, so this
+    is read from `SERRANO_VALIDATION_CHUNK_SIZE` and defaults to the SQLite
+    limit. The backend's `max_query_params` feature is used if it exists,
+    as in later Django versions.
+    """
+    size = getattr(settings, 'SERRANO_VALIDATION_CHUNK_SIZE', None)
+
+    if size is None:
+        features = connections[using].features
+        size = getattr(features, 'max_query_params', None) or \
+            DEFAULT_CHUNK_SIZE
+
+    return size
+
+
+def chunked(values, size):
+    "Splits the values into lists of at most `size` values."
+    values = list(values)
+    return [values[i:i + size] for i in xrange(0, len(values), size)]
+
+
+class MembershipCache(object):
+    "Valid values of each field keyed by the field's data version."
+
+    def __init__(self):
+        self.fields = {}
+        self.lock = Lock()
+
+    def _version(self, instance):
+        return instance.data_version
+
+    def get(self, instance):
+        version = self._version(instance)
+
+        with self.lock:
+            cached = self.fields.get(instance.pk)
+
+            if cached and cached[0] == version:
+                return cached[1]
+
+        return frozenset()
+
+    def add(self, instance, values):
+        version = self._version(instance)
+        size = getattr(settings, 'SERRANO_VALIDATION_CACHE_SIZE',
+                       DEFAULT_CACHE_SIZE)
+
+        with self.lock:
+            cached = self.fields.get(instance.pk)
+
+            if not cached or cached[0] != version:
+                cached = (version, frozenset())
+
+            known = cached[1] | frozenset(values)
+
+            # Stop remembering values rather than growing without bound
+            if len(known) <= size:
+                self.fields[instance.pk] = (version, known)
+
+
+membership = MembershipCache()
+
+
+def validate_values(instance, queryset, values, cache=False):
+    """Returns the set of `values` that exist in `queryset` for the field.
+
+    If `cache` is true, values known to be valid are not queried again. This
+    must only be used for querysets that are not filtered by a context.
+    """
+    field_name = instance.field_name
+    values = set(values)
+    valid = set()
+
+    if cache:
+        valid = values & membership.get(instance)
+        values -= valid
+
+    if not values:
+        return valid
+
+    # The chunk is bound along with the parameters of the queryset, e.g.
+    # those of the applied context.
+    try:
+        params = queryset.query.sql_with_params()[1]
+    except EmptyResultSet:
+        return valid
+
+    size = max(get_chunk_size(queryset.db) - len(params), 1)
+
+    for chunk in chunked(values, size):
+        lookup = {'{0}__in'.format(field_name): chunk}
+        valid.update(queryset.filter(**lookup)
+                     .values_list(field_name, flat=True))
+
+    if cache:
+        membership.add(instance, valid)
+
+    return valid
@@ -24,13 +24,16 @@ kwargs = {
         'avocado[permissions,search,extras]>=2.1,<2.2'
         'coverage',
         'whoosh',
-        'python-memcached>=1.48'
+        'python-memcached>=1.48',
+        'numpy',
     ],
 
     'test_suite': 'test_suite',
 
     # Optional dependencies
-    'extras_require': {},
+    'extras_require': {
+        'numpy': ['numpy'],
+    },
 
     # Metadata
     'name': 'serrano',
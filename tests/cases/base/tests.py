@@ -1,10 +1,38 @@
+import os
+import json
 import time
-from django.test import TestCase
+import uuid
+import shutil
+import threading
+import tempfile
+from django.db.models import Count, get_model
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
 from django.test.utils import override_settings
+from django.core import management
+from django.core.cache import cache, get_cache
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.contrib.sessions.models import Session
+from django.utils.unittest import skipUnless
+from avocado.models import DataField
+from avocado.events.models import Log
+from avocado.stats import kmeans
+from preserialize import serialize as preserialize
+from serrano import catalog
+from serrano import index
+from serrano import usage
+from serrano.serializers import serialize
+from serrano.stats import compute_stats, compute_batch_stats
+from serrano import kmeans as vectorized
+from serrano.backends import TokenBackend
+from serrano.links import get_links
+from serrano import throttle
+from serrano.throttle import FixedWindowLimiter, SlidingWindowLimiter, \
+    LocalLimiter
 from serrano.tokens import token_generator
+from .models import Month, Report
 
 
 class TokenTestCase(TestCase):
@@ -63,6 +91,35 @@ class TokenBackendTestCase(TestCase):
         token = token_generator.make(user)
         self.assertEqual(user, authenticate(token=token))
 
+    def test_cache(self):
+        backend = TokenBackend()
+        user = User.objects.create_user(username='foo', password='bar')
+        token = token_generator.make(user)
+        self.assertEqual(user, backend.authenticate(token=token))
+
+        # Served from the cache until the password changes
+        with self.assertNumQueries(0):
+            self.assertEqual(user, backend.authenticate(token=token))
+
+        user.set_password('new')
+        user.save()
+        self.assertEqual(backend.authenticate(token=token), None)
+
+    @override_settings(SERRANO_TOKEN_CACHE_TIMEOUT=1)
+    def test_cache_timeout(self):
+        backend = TokenBackend()
+        user = User.objects.create_user(username='foo', password='bar')
+        token = token_generator.make(user)
+        self.assertEqual(user, backend.authenticate(token=token))
+
+        # Changes made without signals, e.g. by another process, apply once
+        # the entry expires
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        self.assertEqual(user, backend.authenticate(token=token))
+
+        time.sleep(1.5)
+        self.assertEqual(backend.authenticate(token=token), None)
+
     @override_settings(SERRANO_AUTH_REQUIRED=True)
     def test_resource(self):
         user = User.objects.create_user(username='foo', password='bar')
@@ -86,6 +143,26 @@ class TokenBackendTestCase(TestCase):
             HTTP_ACCEPT='application/json')
         self.assertEqual(resp.status_code, 200)
 
+    @override_settings(SERRANO_AUTH_REQUIRED=True,
+                       SERRANO_STATELESS_TOKENS=True)
+    def test_stateless_resource(self):
+        user = User.objects.create_user(username='foo', password='bar')
+        token = token_generator.make(user)
+        count = Session.objects.count()
+
+        for i in xrange(3):
+            resp = self.client.get(reverse('serrano:root'), {'token': token},
+                HTTP_ACCEPT='application/json')
+            self.assertEqual(resp.status_code, 200)
+
+        # No sessions are saved for the requests
+        self.assertEqual(Session.objects.count(), count)
+
+        # The user is not logged into a session
+        resp = self.client.get(reverse('serrano:root'),
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(resp.status_code, 401)
+
     @override_settings(SERRANO_AUTH_REQUIRED=True, SESSION_COOKIE_AGE=2, SESSION_SAVE_EVERY_REQUEST=True)
     def test_session_timeout(self):
         User.objects.create_user(username='foo', password='bar')
@@ -105,3 +182,465 @@ class TokenBackendTestCase(TestCase):
         resp = self.client.get(reverse('serrano:root'),
             HTTP_ACCEPT='application/json')
         self.assertEqual(resp.status_code, 401)
+
+
+class LinksTestCase(TestCase):
+    def test(self):
+        request = RequestFactory().get('/')
+        links = get_links(request)
+
+        self.assertEqual(links('serrano:field', 4),
+            request.build_absolute_uri(reverse('serrano:field', args=[4])))
+        self.assertEqual(
+            links('serrano:queries:revision_for_object', 2, 13),
+            request.build_absolute_uri(reverse(
+                'serrano:queries:revision_for_object', args=[2, 13])))
+
+
+class LimiterTestCase(TestCase):
+    def assertLimits(self, limiter):
+        key = uuid.uuid4().hex
+
+        self.assertFalse(limiter.is_limited(key, 2, 60))
+        self.assertFalse(limiter.is_limited(key, 2, 60))
+        self.assertTrue(limiter.is_limited(key, 2, 60))
+
+    def test_fixed_window(self):
+        self.assertLimits(FixedWindowLimiter())
+
+    def test_sliding_window(self):
+        self.assertLimits(SlidingWindowLimiter())
+
+    def test_sliding_window_previous(self):
+        limiter = SlidingWindowLimiter()
+        key = uuid.uuid4().hex
+
+        self.assertFalse(limiter.is_limited(key, 2, 60))
+
+        # The previous window is read once, further requests only increment
+        # the current window
+        self.assertEqual(limiter.previous[key][1], 0)
+        cache.set('{0}{1}:{2}'.format(limiter.prefix, key,
+                                      limiter.previous[key][0] - 1), 10)
+        self.assertFalse(limiter.is_limited(key, 2, 60))
+
+    def test_unavailable(self):
+        # Requests are not limited if the cache cannot be reached
+        unavailable = get_cache(
+            'django.core.cache.backends.memcached.MemcachedCache',
+            LOCATION='127.0.0.1:1')
+
+        original = throttle.cache
+        throttle.cache = unavailable
+
+        try:
+            for limiter in (FixedWindowLimiter(), SlidingWindowLimiter()):
+                for i in range(3):
+                    self.assertFalse(limiter.is_limited('foo', 1, 60))
+        finally:
+            throttle.cache = original
+
+    def test_local(self):
+        limiter = LocalLimiter()
+        self.assertLimits(limiter)
+
+        # New window once the current one expires
+        self.assertTrue(limiter.is_limited('foo', 0, 1))
+        time.sleep(1.5)
+        self.assertFalse(limiter.is_limited('foo', 1, 1))
+
+
+@skipUnless(vectorized.available, 'NumPy is not installed')
+class VectorizedKmeansTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        rows = get_model('tests', 'title').objects.values_list('salary')\
+            .annotate(count=Count('pk')).order_by('salary')
+
+        self.points = [[float(salary)] for salary, count in rows]
+        self.counts = [count for salary, count in rows]
+
+        # The outlier comes first so the remaining points are shifted
+        self.outlier_points = [[5000.0]] + \
+            [[float(i % 100)] for i in range(200)]
+        self.outlier_counts = [1] + [i % 7 + 1 for i in range(200)]
+
+    def assertCentroidsEqual(self, first, second):
+        self.assertEqual(len(first), len(second))
+
+        for a, b in zip(first, second):
+            self.assertEqual(a['count'], b['count'])
+
+            for x, y in zip(a['values'], b['values']):
+                self.assertAlmostEqual(x, y)
+
+    def test_find_outliers(self):
+        self.assertEqual(
+            vectorized.find_outliers(self.points, normalized=False),
+            kmeans.find_outliers(self.points, normalized=False))
+
+        self.assertEqual(
+            vectorized.find_outliers(self.outlier_points, normalized=False),
+            [0])
+        self.assertEqual(
+            kmeans.find_outliers(self.outlier_points, normalized=False), [0])
+
+    def test_weighted_counts(self):
+        points, outliers = vectorized.weighted_counts(
+            self.points, self.counts, 2)
+        expected, expected_outliers = kmeans.weighted_counts(
+            self.points, self.counts, 2)
+
+        self.assertCentroidsEqual(points, expected)
+        self.assertEqual(outliers, expected_outliers)
+
+    def test_split_outliers(self):
+        rows = [(10000, 2), (15000, 3), (200000, 1)]
+        points, counts = vectorized.to_arrays(rows)
+
+        self.assertEqual(points.tolist(), [[10000.0], [15000.0], [200000.0]])
+        self.assertEqual(counts.tolist(), [2, 3, 1])
+
+        points, outliers = vectorized.split_outliers(points, counts, [2])
+
+        self.assertEqual(points, [
+            {'values': [10000.0], 'count': 2},
+            {'values': [15000.0], 'count': 3},
+        ])
+        self.assertEqual(outliers, [{'values': [200000.0], 'count': 1}])
+
+    def test_weighted_counts_outliers(self):
+        points, outliers = vectorized.weighted_counts(
+            self.outlier_points, self.outlier_counts, 3)
+
+        self.assertEqual(outliers, [[5000.0]])
+
+        # Avocado looks up the counts by the index of the point after the
+        # outliers are removed, so the counts are only aligned with the
+        # points if the outliers are removed from the counts too.
+        counts = self.outlier_counts[1:]
+        expected, expected_outliers = kmeans.weighted_counts(
+            self.outlier_points, counts, 3)
+
+        self.assertCentroidsEqual(points, expected)
+        self.assertEqual(outliers, expected_outliers)
+
+
+class ValueIndexTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        management.call_command('avocado', 'init', 'tests', quiet=True,
+                                publish=False, concepts=False)
+        self.index_dir = os.path.join(tempfile.mkdtemp(), 'index')
+        index._indexes.clear()
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.index_dir))
+        index._indexes.clear()
+
+    def get_field(self, model_name, field_name):
+        return DataField.objects.get(app_name='tests', model_name=model_name,
+                                     field_name=field_name)
+
+    def test_persisted(self):
+        field = self.get_field('title', 'name')
+
+        with self.settings(SERRANO_VALUE_INDEX_DIR=self.index_dir):
+            index.get_index(field)
+
+            self.assertEqual(os.stat(self.index_dir).st_mode & 0777, 0700)
+
+            path = os.path.join(self.index_dir, '{0}.json'.format(field.pk))
+
+            with open(path) as f:
+                data = json.load(f)['index']
+
+            self.assertTrue('Programmer' in data['values'])
+
+            # Loaded from the directory rather than the data
+            index._indexes.clear()
+            get_model('tests', 'title').objects.all().delete()
+
+            self.assertEqual(index.get_index(field).search('gram'), [
+                {'label': 'Programmer', 'value': 'Programmer'},
+            ])
+
+    def test_not_persisted(self):
+        index.get_index(self.get_field('title', 'name'))
+        self.assertFalse(os.path.exists(self.index_dir))
+
+    def test_unsafe_dir(self):
+        field = self.get_field('title', 'name')
+
+        with self.settings(SERRANO_VALUE_INDEX_DIR=self.index_dir):
+            index.get_index(field)
+            os.chmod(self.index_dir, 0777)
+
+            # Indexes are not loaded from directories writable by others
+            index._indexes.clear()
+            get_model('tests', 'title').objects.all().delete()
+
+            self.assertEqual(index.get_index(field).search('gram'), [])
+
+    def test_cache_size(self):
+        name = self.get_field('title', 'name')
+        project = self.get_field('project', 'name')
+
+        with self.settings(SERRANO_VALUE_INDEX_CACHE_SIZE=1):
+            index.get_index(name)
+            index.get_index(project)
+
+        self.assertEqual(index._indexes.keys(), [project.pk])
+
+
+Employee = get_model('tests', 'employee')
+Title = get_model('tests', 'title')
+
+
+class ShadowedEmployee(Employee):
+    "Employee with a property shadowing the `first_name` field."
+    class Meta(object):
+        proxy = True
+        # Registered outside of the tests app so initializing the fields of
+        # the tests app in other test cases does not include this model.
+        app_label = 'serrano'
+
+    def _get_first_name(self):
+        return self.__dict__['first_name'].upper()
+
+    def _set_first_name(self, value):
+        self.__dict__['first_name'] = value
+
+    first_name = property(_get_first_name, _set_first_name)
+
+
+class SerializerTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def assertSerialized(self, queryset, **template):
+        "Asserts the compiled serializer matches preserialize."
+        for obj in queryset:
+            self.assertEqual(serialize(obj, **template),
+                             preserialize.serialize(obj, **template))
+
+        self.assertEqual(serialize(queryset, **template),
+                         preserialize.serialize(queryset, **template))
+
+    def test_selectors(self):
+        self.assertSerialized(Employee.objects.all(),
+                              fields=[':pk', ':local'], exclude=['office'])
+
+    def test_aliases(self):
+        self.assertSerialized(Employee.objects.all(),
+                              fields=['id', 'first', 'surname'],
+                              aliases={'first': 'first_name',
+                                       'surname': 'last_name'})
+
+    def test_prefix_camelcase(self):
+        self.assertSerialized(Employee.objects.all(),
+                              fields=['first_name', 'is_manager'],
+                              prefix='employee_', camelcase=True)
+
+    def test_related_flat(self):
+        self.assertSerialized(Employee.objects.all(),
+                              fields=['first_name', 'title'],
+                              related={'title': {'fields': ['name']}})
+
+    def test_related_merge(self):
+        self.assertSerialized(Employee.objects.all(),
+                              fields=['first_name', 'title'],
+                              related={'title': {
+                                  'fields': ['name', 'salary'],
+                                  'merge': True,
+                                  'prefix': '%(accessor)s_',
+                              }})
+
+    def test_related_nested(self):
+        self.assertSerialized(Employee.objects.all(),
+                              fields=['first_name', 'title', 'office'],
+                              related={
+                                  'title': {'fields': ['name', 'salary']},
+                                  'office': {'fields': [':local']},
+                              })
+
+        self.assertSerialized(Title.objects.all(),
+                              fields=['name', 'employee_set'],
+                              related={'employee_set': {
+                                  'fields': ['first_name', 'office'],
+                                  'related': {
+                                      'office': {'fields': ['location']},
+                                  },
+                              }})
+
+    def test_shadowed_field(self):
+        self.assertSerialized(ShadowedEmployee.objects.all(),
+                              fields=['first_name', 'last_name'])
+
+        self.assertEqual(serialize(ShadowedEmployee.objects.get(pk=1),
+                                   fields=['first_name'])['first_name'],
+                         'ERIC')
+
+    def test_posthook(self):
+        def posthook(obj, attrs):
+            attrs['full_name'] = u'{0} {1}'.format(obj.first_name,
+                                                   obj.last_name)
+            return attrs
+
+        self.assertSerialized(Employee.objects.all(), fields=['id'],
+                              posthook=posthook)
+
+
+class UsageBufferTestCase(TransactionTestCase):
+    def setUp(self):
+        self.buffer = usage.UsageBuffer()
+
+    def tearDown(self):
+        self.buffer.stop()
+
+    def wait(self, condition, timeout=5):
+        "Waits for the worker to satisfy the condition."
+        deadline = time.time() + timeout
+
+        while not condition() and time.time() < deadline:
+            time.sleep(0.05)
+
+    @override_settings(SERRANO_USAGE_BATCH_SIZE=3,
+                       SERRANO_USAGE_FLUSH_INTERVAL=60)
+    def test_flush(self):
+        batches = []
+        write = self.buffer.write
+
+        def record(messages):
+            batches.append(len(messages))
+            write(messages)
+
+        self.buffer.write = record
+
+        for i in xrange(3):
+            self.buffer.put(usage._message('test', data={'i': i}))
+
+        # Saved with a single bulk insert once the batch is full
+        self.wait(lambda: self.buffer.flushed == 3)
+        self.assertEqual(batches, [3])
+        self.assertEqual(self.buffer.backlog, 0)
+        self.assertEqual(self.buffer.dropped, 0)
+        self.assertEqual(sorted(l.data for l in
+                                Log.objects.filter(event='test')),
+                         [{'i': 0}, {'i': 1}, {'i': 2}])
+
+    @override_settings(SERRANO_USAGE_BUFFER_SIZE=1,
+                       SERRANO_USAGE_BATCH_SIZE=1)
+    def test_full(self):
+        writing = threading.Event()
+        release = threading.Event()
+        write = self.buffer.write
+
+        def block(messages):
+            writing.set()
+            release.wait(5)
+            write(messages)
+
+        self.buffer.write = block
+
+        # The worker takes the first event and blocks while saving it
+        self.buffer.put(usage._message('test'))
+        self.assertTrue(writing.wait(5))
+
+        self.buffer.put(usage._message('test'))
+        self.assertEqual(self.buffer.backlog, 1)
+
+        # Dropped rather than blocking since the queue is full
+        self.buffer.put(usage._message('test'))
+        self.assertEqual(self.buffer.backlog, 1)
+        self.assertEqual(self.buffer.dropped, 1)
+
+        release.set()
+        self.wait(lambda: self.buffer.flushed == 2)
+        self.assertEqual(self.buffer.backlog, 0)
+        self.assertEqual(Log.objects.filter(event='test').count(), 2)
+
+    @override_settings(SERRANO_USAGE_BATCH_SIZE=100,
+                       SERRANO_USAGE_FLUSH_INTERVAL=60)
+    def test_stop(self):
+        for i in xrange(5):
+            self.buffer.put(usage._message('test'))
+
+        # Pending events are saved when the worker is stopped
+        self.buffer.stop()
+        self.assertEqual(self.buffer.flushed, 5)
+        self.assertEqual(Log.objects.filter(event='test').count(), 5)
+
+    @override_settings(AVOCADO={})
+    def test_log(self):
+        usage.log('test', model=Title)
+
+        # Buffered since `FORCE_SYNC_LOG` is not set
+        usage.buffer.stop()
+        self.assertTrue(Log.objects.filter(event='test').exists())
+
+
+class BatchStatsTestCase(TestCase):
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        for i, name in enumerate(['January', 'February', 'March']):
+            Month(pk=i + 1, label=name, value=name[:3], order=i).save()
+
+        for pk in (1, 3, 3):
+            Report(month_id=pk).save()
+
+    def test_lexicon(self):
+        # The lexicon field's aggregates are computed on the lexicon model
+        month = DataField(app_name='base', model_name='report',
+                          field_name='month')
+        month.save()
+        salary = DataField(app_name='tests', model_name='title',
+                           field_name='salary')
+        salary.save()
+
+        self.assertTrue(month.lexicon)
+
+        stats = compute_batch_stats([month, salary])
+        self.assertEqual(stats[month.pk], compute_stats(month))
+        self.assertEqual(stats[salary.pk], compute_stats(salary))
+
+
+class LexiconLabelsTestCase(TestCase):
+    def test(self):
+        from serrano.resources.field.values import FieldValues
+
+        for i, name in enumerate(['January', 'February', 'March']):
+            Month(pk=i + 1, label=name, value=name[:3], order=i).save()
+
+        month = DataField(app_name='base', model_name='report',
+                          field_name='month')
+        month.save()
+
+        # The values of lexicon fields are the primary keys of the lexicon
+        self.assertEqual(FieldValues().get_labels(month, [1, 3]),
+                         {1: 'January', 3: 'March'})
+
+
+class CatalogVersionTestCase(TestCase):
+    def test_timeout(self):
+        timeouts = []
+        original = cache.set
+
+        def record(key, value, timeout=None, *args, **kwargs):
+            if key == catalog.VERSION_KEY:
+                timeouts.append(timeout)
+            return original(key, value, timeout, *args, **kwargs)
+
+        cache.set = record
+
+        try:
+            with self.settings(SERRANO_CATALOG_CACHE_TIMEOUT=60):
+                catalog.invalidate()
+        finally:
+            cache.set = original
+
+        # The version does not expire before the catalogs it versions, which
+        # would otherwise happen after the backend's default timeout
+        self.assertEqual(timeouts, [catalog.CATALOG_CACHE_TIMEOUT])
@@ -54,6 +54,98 @@ class ConceptResourceTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(json.loads(response.content)), 2)
 
+    def add_orphan(self):
+        "Adds a published concept with a field that is not installed."
+        field = DataField(app_name='tests', model_name='title',
+                          field_name='XXX', published=True)
+        field.save()
+
+        concept = DataConcept(name='Orphan', published=True)
+        concept.save()
+        DataConceptField(concept=concept, field=field, order=1).save()
+        DataConceptField(concept=concept, field=self.name_field,
+                         order=2).save()
+
+        return field, concept
+
+    @override_settings(SERRANO_CATALOG_CACHE_TIMEOUT=0)
+    def test_get_all_orphan_queries(self):
+        field, concept = self.add_orphan()
+
+        # Start the session so it is not created during the requests below
+        self.client.get('/api/', HTTP_ACCEPT='application/json')
+        self.client.get('/api/', HTTP_ACCEPT='application/json')
+
+        # The orphans are detected in bulk rather than per concept or field.
+        # The first two queries read the session and the user.
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/fields/',
+                HTTP_ACCEPT='application/json')
+
+        pks = [f['id'] for f in json.loads(response.content)]
+        self.assertEqual(len(pks), 5)
+        self.assertFalse(field.pk in pks)
+
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/concepts/', {'embed': True},
+                HTTP_ACCEPT='application/json')
+
+        pks = [c['id'] for c in json.loads(response.content)]
+        self.assertEqual(len(pks), 2)
+        self.assertFalse(concept.pk in pks)
+
+    @override_settings(SERRANO_CATALOG_CACHE_TIMEOUT=0,
+                       SERRANO_CHECK_ORPHANED_FIELDS=False)
+    def test_get_all_embed_queries(self):
+        for i in range(5):
+            concept = DataConcept(name='Concept {0}'.format(i),
+                                  published=True)
+            concept.save()
+            DataConceptField(concept=concept, field=self.salary_field,
+                             order=1).save()
+            DataConceptField(concept=concept, field=self.boss_field,
+                             order=2).save()
+
+        # Start the session so it is not created during the request below
+        self.client.get('/api/', HTTP_ACCEPT='application/json')
+        self.client.get('/api/', HTTP_ACCEPT='application/json')
+
+        # The fields of all concepts are read in one query. The other
+        # queries read the session, the user, the concepts and the
+        # categories.
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/concepts/', {'embed': True},
+                HTTP_ACCEPT='application/json')
+
+        concepts = json.loads(response.content)
+        self.assertEqual(len(concepts), 7)
+
+        for concept in concepts:
+            if concept['name'].startswith('Concept'):
+                self.assertEqual([f['id'] for f in concept['fields']],
+                                 [self.salary_field.pk, self.boss_field.pk])
+
+    def test_get_all_orphan_repaired(self):
+        def get_counts():
+            fields = self.client.get('/api/fields/',
+                HTTP_ACCEPT='application/json')
+            concepts = self.client.get('/api/concepts/', {'embed': True},
+                HTTP_ACCEPT='application/json')
+            return (len(json.loads(fields.content)),
+                    len(json.loads(concepts.content)))
+
+        self.assertEqual(get_counts(), (5, 2))
+
+        # The cached listings are invalidated when the field is orphaned
+        self.salary_field.field_name = 'XXX'
+        self.salary_field.save()
+        self.assertEqual(get_counts(), (4, 1))
+
+        # and again when it is repaired
+        self.salary_field.field_name = 'salary'
+        self.salary_field.save()
+        self.assertEqual(get_counts(), (5, 2))
+
     @override_settings(SERRANO_CHECK_ORPHANED_FIELDS=False)
     def test_get_all_orphan_check_off(self):
         # Orphan one of the fields we are about to embed in the concepts we
@@ -1,10 +1,28 @@
+import os
 import json
-from django.test import TestCase
+import time
+import tempfile
+from cStringIO import StringIO
+from django.contrib.auth.models import User
+from django.core import management
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
 from avocado.conf import OPTIONAL_DEPS
+from avocado.export import JSONExporter
+from avocado.models import DataField, DataConcept, DataConceptField, \
+    DataView
 from serrano.resources import API_VERSION
+from serrano import jobs
+from serrano.export import stream_export, concat_shards, write_json, \
+    ExportError
 
 
 class ExporterResourceTestCase(TestCase):
+    def tearDown(self):
+        # Stop the workers started by queued jobs so they do not outlive
+        # the test database
+        jobs.pool.stop()
+
     def test_get(self):
         response = self.client.get('/api/data/export/',
             HTTP_ACCEPT='application/json')
@@ -47,3 +65,216 @@ class ExporterResourceTestCase(TestCase):
             }
 
         self.assertEqual(json.loads(response.content), expectedResponse)
+
+    def test_export_stream(self):
+        response = self.client.get('/api/data/export/csv/?stream=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertTrue(response['Content-Disposition']
+                        .startswith('attachment; filename="all-'))
+
+        # Consume the stream to be certain the writer finishes cleanly
+        ''.join(response.streaming_content)
+
+    def test_export_stream_buffered(self):
+        # Zipped formats are not written row by row, so are not streamed
+        response = self.client.get('/api/data/export/sas/?stream=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+
+    def test_write_json(self):
+        class Exporter(JSONExporter):
+            def read(self, iterable, *args, **kwargs):
+                for row in iterable:
+                    yield (value for value in row)
+
+        rows = [[1, 'a'], [2, 'b']]
+
+        buff = StringIO()
+        write_json(Exporter(), iter(rows), buff)
+
+        # The same as Avocado's exporter which encodes all rows at once
+        self.assertEqual(buff.getvalue(), Exporter().write(rows).getvalue())
+        self.assertEqual(json.loads(buff.getvalue()), rows)
+
+        buff = StringIO()
+        write_json(Exporter(), iter([]), buff)
+        self.assertEqual(buff.getvalue(), Exporter().write([]).getvalue())
+
+    @override_settings(SERRANO_EXPORT_JOBS_DIR=tempfile.mkdtemp())
+    def test_export_job(self):
+        # A session is created for the job if one does not exist
+        response = self.client.post('/api/data/export/csv/jobs/',
+            data='{}', content_type='application/json',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+
+        job = json.loads(response.content)
+        self.assertEqual(job['type'], 'csv')
+        self.assertTrue(job['status'] in ('queued', 'running', 'complete'))
+        self.assertEqual(response['Location'], job['_links']['self']['href'])
+
+        response = self.client.get(job['_links']['self']['href'],
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['id'], job['id'])
+
+    @override_settings(SERRANO_EXPORT_JOBS_DIR=tempfile.mkdtemp())
+    def test_export_job_download(self):
+        # Initialize the session
+        self.client.get('/api/data/export/', HTTP_ACCEPT='application/json')
+
+        job = jobs.ExportJob(export_type='csv', status=jobs.COMPLETE,
+                             filename='download.csv',
+                             session_key=self.client.session.session_key)
+        job.save()
+
+        with open(job.file_path, 'w') as f:
+            f.write('a,b\n1,2\n')
+
+        response = self.client.get(
+            '/api/data/export/jobs/{0}/download/'.format(job.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(''.join(response.streaming_content), 'a,b\n1,2\n')
+
+    @override_settings(SERRANO_EXPORT_JOBS_DIR=tempfile.mkdtemp(),
+                       SERRANO_EXPORT_JOB_TIMEOUT=0,
+                       SERRANO_EXPORT_JOB_EXPIRY=0)
+    def test_export_job_cleanup(self):
+        job = jobs.ExportJob(export_type='csv', status=jobs.RUNNING)
+        job.save()
+
+        jobs._ensure_dir(jobs.queue.claimed_dir)
+        open(os.path.join(jobs.queue.claimed_dir, '0-' + job.id), 'w').close()
+
+        # Interrupted jobs are failed and then expire
+        jobs.queue.fail_stale()
+        self.assertEqual(jobs.ExportJob.load(job.id).status, jobs.FAILED)
+        self.assertEqual(os.listdir(jobs.queue.claimed_dir), [])
+
+        jobs.queue.purge()
+        self.assertEqual(jobs.ExportJob.load(job.id), None)
+
+    def test_export_job_private(self):
+        jobs_dir = os.path.join(tempfile.mkdtemp(), 'jobs')
+
+        with self.settings(SERRANO_EXPORT_JOBS_DIR=jobs_dir):
+            job = jobs.ExportJob(export_type='csv', tree='default',
+                                 context={}, view={})
+            job.save()
+            job.run()
+
+            self.assertEqual(os.stat(jobs_dir).st_mode & 0777, 0700)
+            self.assertEqual(os.stat(job.file_path).st_mode & 0777, 0600)
+
+            # Directories writable by other users are not used
+            os.chmod(jobs_dir, 0777)
+            self.assertRaises(OSError, job.save)
+
+    @override_settings(SERRANO_EXPORT_JOBS_DIR=tempfile.mkdtemp(),
+                       SERRANO_EXPORT_JOB_TIMEOUT=60)
+    def test_export_job_claimed(self):
+        job = jobs.ExportJob(export_type='csv')
+        job.save()
+        jobs.queue.put(job)
+
+        # The job waited in the queue for longer than the timeout
+        past = time.time() - 120
+        os.utime(job.path, (past, past))
+        for name in os.listdir(jobs.queue.queue_dir):
+            os.utime(os.path.join(jobs.queue.queue_dir, name), (past, past))
+
+        claimed = jobs.queue.claim()
+        self.assertEqual(claimed.id, job.id)
+
+        # Not failed since the timeout starts once the job is claimed
+        jobs.queue.fail_stale()
+        self.assertEqual(jobs.ExportJob.load(job.id).status, jobs.QUEUED)
+        self.assertTrue(os.path.exists(claimed.marker))
+
+        jobs.queue.release(claimed)
+
+    def test_export_job_not_found(self):
+        response = self.client.get('/api/data/export/jobs/abc123/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_stream_error(self):
+        class FailingExporter(object):
+            def write(self, iterable, buff, **kwargs):
+                buff.write('partial')
+                buff.flush()
+                raise ValueError
+
+        # The stream is aborted rather than ending as if it were complete
+        chunks = stream_export(FailingExporter(), list)
+        self.assertEqual(next(chunks), 'partial')
+        self.assertRaises(ExportError, next, chunks)
+
+    def _shards(self, contents):
+        paths = []
+        for content in contents:
+            fd, path = tempfile.mkstemp()
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            paths.append(path)
+        return paths
+
+    def test_concat_csv_shards(self):
+        paths = self._shards(['a,b\r\n1,2\r\n', 'a,b\r\n', 'a,b\r\n3,4\r\n'])
+
+        content = ''.join(concat_shards('csv', paths))
+        self.assertEqual(content, 'a,b\r\n1,2\r\n3,4\r\n')
+        self.assertFalse(any(os.path.exists(p) for p in paths))
+
+    def test_concat_json_shards(self):
+        paths = self._shards(['[{"a": 1}]', '[]', '[{"a": 2}, {"a": 3}]'])
+
+        content = ''.join(concat_shards('json', paths))
+        self.assertEqual(json.loads(content), [{'a': 1}, {'a': 2}, {'a': 3}])
+        self.assertFalse(any(os.path.exists(p) for p in paths))
+
+
+@override_settings(SERRANO_EXPORT_PROCESSES=2)
+class ShardedExportTestCase(TransactionTestCase):
+    # The shards are written by other processes, so the data must be
+    # committed rather than in a test transaction
+    fixtures = ['test_data.json']
+
+    def setUp(self):
+        management.call_command('avocado', 'init', 'tests', quiet=True,
+                                publish=False, concepts=False)
+
+        user = User.objects.create_user(username='root', password='root')
+        self.client.login(username='root', password='root')
+
+        columns = []
+
+        for model_name, field_name in (('employee', 'first_name'),
+                                       ('title', 'salary')):
+            field = DataField.objects.get(app_name='tests',
+                                          model_name=model_name,
+                                          field_name=field_name)
+            concept = DataConcept(name=field_name, published=True)
+            concept.save()
+            DataConceptField(concept=concept, field=field, order=1).save()
+            columns.append(concept.pk)
+
+        DataView(user=user, session=True, json={'columns': columns}).save()
+
+    def export(self, export_type, parallel):
+        response = self.client.get('/api/data/export/{0}/'.format(export_type),
+                                   {'parallel': parallel})
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_csv(self):
+        content = self.export('csv', 'true')
+        self.assertEqual(content, self.export('csv', 'false'))
+        self.assertEqual(len(content.splitlines()), 7)
+
+    def test_json(self):
+        content = json.loads(self.export('json', 'true'))
+        self.assertEqual(content, json.loads(self.export('json', 'false')))
+        self.assertEqual(len(content), 6)
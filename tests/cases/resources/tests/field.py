@@ -1,4 +1,5 @@
 import json
+from django.db.models import F
 from django.test.utils import override_settings
 from avocado.models import DataField, Log
 from .base import BaseTestCase
@@ -11,6 +12,20 @@ class FieldResourceTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(json.loads(response.content)), 5)
 
+    def test_get_all_cache(self):
+        response = self.client.get('/api/fields/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(len(json.loads(response.content)), 5)
+
+        # Saving a field invalidates the cached catalog
+        field = DataField.objects.get(pk=2)
+        field.published = False
+        field.save()
+
+        response = self.client.get('/api/fields/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(len(json.loads(response.content)), 4)
+
     def test_get_all_orphan(self):
         # Orphan one of the fields we are about to retrieve
         DataField.objects.filter(pk=2).update(field_name="XXX")
@@ -79,6 +94,62 @@ class FieldResourceTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(json.loads(response.content)['values'])
 
+    def test_values_page(self):
+        # title.name
+        response = self.client.get('/api/fields/2/values/?limit=3&page=2',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.content)
+        self.assertEqual(data['num_pages'], 3)
+        self.assertEqual(data['values'], [
+            {'label': 'IT', 'value': 'IT'},
+            {'label': 'Lawyer', 'value': 'Lawyer'},
+            {'label': 'Programmer', 'value': 'Programmer'},
+        ])
+
+    def test_values_queryset(self):
+        from serrano.resources.field.values import FieldValues
+
+        # The paginated values are read from the overridable queryset
+        get_values_queryset = FieldValues.get_values_queryset
+        FieldValues.get_values_queryset = lambda self, request, instance: \
+            instance.values_list().filter(name__startswith='P')
+
+        try:
+            response = self.client.get('/api/fields/2/values/',
+                HTTP_ACCEPT='application/json')
+        finally:
+            FieldValues.get_values_queryset = get_values_queryset
+
+        values = json.loads(response.content)['values']
+        self.assertEqual([datum['value'] for datum in values], ['Programmer'])
+
+    def test_values_labels(self):
+        from serrano.resources.field.values import FieldValues
+
+        # Labels of the page are resolved without reading all choices
+        field = DataField.objects.get(pk=2)
+
+        with self.assertNumQueries(0):
+            labels = FieldValues().get_labels(field, ['IT', 'QA'])
+
+        self.assertEqual(labels, {'IT': 'IT', 'QA': 'QA'})
+
+    @override_settings(SERRANO_VALIDATION_CHUNK_SIZE=3)
+    def test_validate_chunks(self):
+        from serrano.validation import validate_values
+
+        field = DataField.objects.get(pk=2)
+        queryset = Title.objects.filter(salary__gt=0, salary__lt=1000000)
+
+        # The two parameters of the queryset leave room for one value
+        with self.assertNumQueries(4):
+            valid = validate_values(field, queryset,
+                                    ['IT', 'QA', 'CEO', 'Nope'])
+
+        self.assertEqual(valid, set(['IT', 'QA', 'CEO']))
+
     def test_values_random(self):
         # Random values
         response = self.client.get('/api/fields/2/values/?random=3',
@@ -86,6 +157,42 @@ class FieldResourceTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(json.loads(response.content)), 3)
 
+    def test_sample_values(self):
+        from serrano.resources.field.values import FieldValues
+
+        resource = FieldValues()
+        field = DataField.objects.get(pk=2)
+
+        # The implementation prior to sampling by primary key
+        def previous(size):
+            return [obj.name for obj in Title.objects.only('name')
+                    .order_by('?')[:size]]
+
+        names = list(Title.objects.values_list('name', flat=True))
+
+        for size in range(1, len(names) + 3):
+            sample = resource.sample_values(field, size)
+            expected = previous(size)
+
+            self.assertEqual(len(sample), len(expected))
+            self.assertEqual(len(set(sample)), len(sample))
+            self.assertTrue(set(sample) <= set(names))
+
+        # Every row is sampled when the size exceeds the rows
+        self.assertEqual(sorted(resource.sample_values(field, 10)),
+                         sorted(previous(10)))
+
+        # The row with the highest key is sampled as well, rather than the
+        # lower of the drawn keys always being taken
+        last = Title.objects.order_by('-pk')[0].name
+        self.assertTrue(any(resource.sample_values(field, 1) == [last]
+                            for i in xrange(200)))
+
+        # Sparse keys
+        Title.objects.exclude(pk__in=[1, 7]).delete()
+        self.assertEqual(sorted(resource.sample_values(field, 2)),
+                         sorted(previous(2)))
+
     def test_values_query(self):
         # Query values
         response = self.client.get('/api/fields/2/values/?query=a',
@@ -101,6 +208,22 @@ class FieldResourceTestCase(BaseTestCase):
         message = Log.objects.get(event='values', object_id=2)
         self.assertEqual(message.data['query'], 'a')
 
+    def test_values_query_index(self):
+        # Matched using the trigram index
+        response = self.client.get('/api/fields/2/values/?query=GRAM',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(response.content)['values'], [
+            {'label': 'Programmer', 'value': 'Programmer'},
+        ])
+
+    @override_settings(SERRANO_VALUE_INDEX=None)
+    def test_values_query_no_index(self):
+        response = self.client.get('/api/fields/2/values/?query=GRAM',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(response.content)['values'], [
+            {'label': 'Programmer', 'value': 'Programmer'},
+        ])
+
     def test_values_validate(self):
         # Valid, single dict
         response = self.client.post('/api/fields/2/values/',
@@ -188,6 +311,43 @@ class FieldResourceTestCase(BaseTestCase):
         self.assertEqual(stats['min'], '2000-01-01')
         self.assertEqual(stats['max'], '2010-01-01')
 
+    def test_stats_store(self):
+        from serrano.models import DataFieldStats
+
+        # title.salary
+        response = self.client.get('/api/fields/3/stats/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(DataFieldStats.objects.filter(field__pk=3).exists())
+
+        # Stats are served from the store until the data is modified
+        Title.objects.all().delete()
+
+        response = self.client.get('/api/fields/3/stats/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(response.content)['max'], 200000)
+
+        field = DataField.objects.get(pk=3)
+        field.data_version += 1
+        field.save()
+
+        response = self.client.get('/api/fields/3/stats/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(response.content)['max'], None)
+
+    def test_batch_stats(self):
+        # title.name, title.salary, project.due_date and a field that is not
+        # published
+        response = self.client.get('/api/fields/stats/?ids=2&ids=3&ids=11&ids=1',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        stats = json.loads(response.content)
+        self.assertEqual(sorted(stats.keys()), ['11', '2', '3'])
+        self.assertEqual(stats['3']['max'], 200000)
+        self.assertEqual(stats['11']['min'], '2000-01-01')
+        self.assertTrue('distinct_count' in stats['2'])
+
     def test_empty_stats(self):
         Title.objects.all().delete()
 
@@ -221,3 +381,104 @@ class FieldResourceTestCase(BaseTestCase):
             }],
         })
         self.assertTrue(Log.objects.filter(event='dist', object_id=3).exists())
+
+    @override_settings(SERRANO_DIST_CACHE_TIMEOUT=0)
+    def test_dist_vectorized(self):
+        from serrano import kmeans as vectorized
+
+        def get_dist():
+            response = self.client.get('/api/fields/3/dist/',
+                HTTP_ACCEPT='application/json')
+            data = json.loads(response.content)
+            data['data'].sort(key=lambda p: p['values'])
+            return data
+
+        # Avocado's implementation is used without NumPy
+        with self.settings(SERRANO_VECTORIZED_DISTRIBUTION=False):
+            expected = get_dist()
+
+        self.assertEqual(expected['data'], [
+            {u'count': 1, u'values': [10000]},
+            {u'count': 3, u'values': [15000]},
+            {u'count': 1, u'values': [20000]},
+            {u'count': 1, u'values': [200000]},
+        ])
+
+        if vectorized.available:
+            self.assertEqual(get_dist(), expected)
+
+    def test_dist_cache(self):
+        # title.salary
+        response = self.client.get('/api/fields/3/dist/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(response.content)['size'], 4)
+
+        # Cached until the data is marked as modified
+        Title.objects.filter(salary=10000).update(salary=15000)
+
+        response = self.client.get('/api/fields/3/dist/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(response.content)['size'], 4)
+
+        DataField.objects.filter(pk=3).update(
+            data_version=F('data_version') + 1)
+
+        response = self.client.get('/api/fields/3/dist/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(response.content)['size'], 3)
+
+    def test_dist_binned(self):
+        # title.salary
+        response = self.client.get('/api/fields/3/dist/?binning=width&bins=2',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {
+            u'size': 2,
+            u'clustered': False,
+            u'binned': u'width',
+            u'outliers': [],
+            u'data': [{
+                u'count': 5,
+                u'values': [57500],
+                u'range': [[10000, 105000]],
+            }, {
+                u'count': 1,
+                u'values': [152500],
+                u'range': [[105000, 200000]],
+            }],
+        })
+
+    def test_quantile_edges(self):
+        from serrano.binning import _quantile_edges
+
+        queryset = Title.objects.filter(salary__isnull=False)
+        salaries = sorted(queryset.values_list('salary', flat=True))
+
+        # Each edge is read by a single row query after counting the rows
+        with self.assertNumQueries(4):
+            edges = _quantile_edges(queryset, 'salary', None, 4)
+
+        self.assertEqual(edges, [salaries[len(salaries) * i / 4]
+                                 for i in range(1, 4)])
+
+    def test_dist_binned_quantile(self):
+        # title.salary
+        response = self.client.get(
+            '/api/fields/3/dist/?binning=quantile&bins=2',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {
+            u'size': 2,
+            u'clustered': False,
+            u'binned': u'quantile',
+            u'outliers': [],
+            u'data': [{
+                u'count': 1,
+                u'values': [12500],
+                u'range': [[10000, 15000]],
+            }, {
+                u'count': 5,
+                u'values': [107500],
+                u'range': [[15000, 200000]],
+            }],
+        })
@@ -1,6 +1,12 @@
 import json
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
 from django.test import TestCase
+from avocado.models import DataField, DataConcept, DataConceptField, \
+    DataView
+from tests.models import Employee
+from .base import BaseTestCase
 
 
 class PreviewResourceTestCase(TestCase):
@@ -54,3 +60,146 @@ class PreviewResourceTestCase(TestCase):
             'num_pages': 1,
             'limit': 20,
         })
+
+    def test_get_invalid_cursor(self):
+        # Invalid cursors are ignored in favor of the page
+        response = self.client.get('/api/data/preview/?cursor=abc',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['page_num'], 1)
+
+
+class PreviewCountTestCase(BaseTestCase):
+    def setUp(self):
+        super(PreviewCountTestCase, self).setUp()
+        cache.clear()
+
+    def get_count(self):
+        response = self.client.get('/api/data/preview/',
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['object_count']
+
+    def test_cached(self):
+        self.client.login(username='root', password='password')
+        self.assertEqual(self.get_count(), 6)
+
+        Employee.objects.create(first_name='Jane', last_name='Doe',
+                                office_id=1)
+        self.assertEqual(self.get_count(), 6)
+
+        # Modifying the data of a field invalidates the count
+        DataField.objects.filter(pk=1).update(
+            data_version=F('data_version') + 1)
+        self.assertEqual(self.get_count(), 7)
+
+    def test_owner(self):
+        self.client.login(username='root', password='password')
+        self.assertEqual(self.get_count(), 6)
+
+        Employee.objects.create(first_name='Jane', last_name='Doe',
+                                office_id=1)
+
+        # Counts are not shared between users
+        User.objects.create_user(username='other', password='other')
+        self.client.logout()
+        self.client.login(username='other', password='other')
+        self.assertEqual(self.get_count(), 7)
+
+
+class PreviewCursorTestCase(BaseTestCase):
+    def setUp(self):
+        super(PreviewCursorTestCase, self).setUp()
+        self.client.login(username='root', password='password')
+
+        self.salary = self.get_concept('title', 'salary')
+        self.due_date = self.get_concept('project', 'due_date')
+
+    def get_concept(self, model_name, field_name):
+        field = DataField.objects.get(app_name='tests', model_name=model_name,
+                                      field_name=field_name)
+        concept = DataConcept(name=field_name, published=True)
+        concept.save()
+        DataConceptField(concept=concept, field=field, order=1).save()
+        return concept
+
+    def set_view(self, json):
+        DataView(user=self.user, session=True, json=json).save()
+
+    def walk(self, url, link='next'):
+        """Returns the pk and values of the rows of each page and the links
+        followed to the pages.
+        """
+        pages = []
+        links = []
+
+        while url:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+
+            pages.append([(o['pk'], o['values']) for o in data['objects']])
+            url = data['_links'].get(link, {}).get('href')
+
+            if url:
+                links.append(url)
+
+        return pages, links
+
+    def rows(self, pages):
+        return [row for page in pages for row in page]
+
+    def test_ties(self):
+        # Three employees have a salary of 15000
+        self.set_view({
+            'columns': [self.salary.pk],
+            'ordering': [[self.salary.pk, 'asc']],
+        })
+
+        pages, links = self.walk('/api/data/preview/?limit=2')
+        self.assertEqual([len(page) for page in pages], [2, 2, 2])
+        self.assertEqual([pk for pk, values in self.rows(pages)],
+                         [6, 1, 3, 5, 2, 4])
+        self.assertTrue(all('cursor=' in link for link in links))
+
+    def test_ties_desc(self):
+        self.set_view({
+            'columns': [self.salary.pk],
+            'ordering': [[self.salary.pk, 'desc']],
+        })
+
+        pages, links = self.walk('/api/data/preview/?limit=2')
+        self.assertEqual([pk for pk, values in self.rows(pages)],
+                         [4, 2, 1, 3, 5, 6])
+        self.assertTrue(all('cursor=' in link for link in links))
+
+    def test_prev(self):
+        self.set_view({
+            'columns': [self.salary.pk],
+            'ordering': [[self.salary.pk, 'asc']],
+        })
+
+        pages, links = self.walk('/api/data/preview/?limit=2&page=3',
+                                 link='prev')
+        self.assertEqual([[pk for pk, values in page] for page in pages],
+                         [[2, 4], [3, 5], [6, 1]])
+        self.assertTrue(all('cursor=' in link for link in links))
+
+    def test_multiple_rows(self):
+        # Employees 2 and 3 have a row for each of their three projects,
+        # so the cursors must be based on the last row of each page
+        self.set_view({
+            'columns': [self.due_date.pk],
+            'ordering': [[self.due_date.pk, 'desc']],
+        })
+
+        expected = self.rows(self.walk('/api/data/preview/?limit=10')[0])
+        self.assertEqual(len(expected), 10)
+
+        pages, links = self.walk('/api/data/preview/?limit=3')
+        self.assertEqual(self.rows(pages), expected)
+
+        # Rows without a due date cannot be sought to and fallback to
+        # the offset
+        self.assertEqual(['cursor=' in link for link in links],
+                         [True, True, False])
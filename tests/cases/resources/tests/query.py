@@ -5,6 +5,7 @@ from django.core import mail
 from django.test.utils import override_settings
 from restlib2.http import codes
 from avocado.models import DataQuery
+from serrano import access
 from .base import AuthenticatedBaseTestCase, BaseTestCase
 
 class QueriesResourceTestCase(AuthenticatedBaseTestCase):
@@ -311,6 +312,23 @@ class QueryForksResourceTestCase(AuthenticatedBaseTestCase):
 
 
 class QueryResourceTestCase(AuthenticatedBaseTestCase):
+    @override_settings(SERRANO_ACCESS_FLUSH_INTERVAL=3600)
+    def test_get_coalesced_access(self):
+        query = DataQuery(user=self.user)
+        query.save()
+
+        response = self.client.get('/api/queries/{0}/'.format(query.pk),
+            HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, codes.ok)
+
+        # Not updated until the pending timestamps are flushed
+        self.assertEqual(query.accessed,
+                DataQuery.objects.get(pk=query.pk).accessed)
+
+        access.flush()
+        self.assertLess(query.accessed,
+                DataQuery.objects.get(pk=query.pk).accessed)
+
     def test_get(self):
         query = DataQuery(user=self.user)
         query.save()
@@ -43,6 +43,9 @@ SERRANO_AUTH_RATE_LIMIT_COUNT=40
 SERRANO_RATE_LIMIT_SECONDS=3
 SERRANO_AUTH_RATE_LIMIT_SECONDS=6
 
+# Update accessed timestamps on every read
+SERRANO_ACCESS_FLUSH_INTERVAL=0
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',